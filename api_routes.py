@@ -1,15 +1,24 @@
 import os
 import uuid
+import base64
+import hashlib
 import logging
 import json
 import requests
-from flask import Blueprint, request, jsonify, session
+import threading
+from flask import Blueprint, request, jsonify, session, Response
+from sqlalchemy import and_, or_
 from app import db
-from models import SubtitleTask
+from config import Config
+from models import SubtitleTask, unpack_segments, status_dict, list_dict
+from whisper_subtitler import render_subtitles
 from gofile_api import get_gofile_server
+from transcription_cache import get_cache
+from storage import LocalStorage, get_storage
+import task_events
 # Import the celery task after all other imports to avoid circular imports
-from celery_worker import generate_subtitles
-from datetime import datetime
+from celery_worker import start_pipeline
+from datetime import datetime, timedelta, timezone
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
@@ -18,6 +27,9 @@ logger = logging.getLogger(__name__)
 # Create Blueprint
 api_bp = Blueprint('api', __name__)
 
+# Open /task/<id>/events streams of this process, each holding a worker thread
+_event_streams = threading.BoundedSemaphore(Config.TASK_EVENTS_MAX_STREAMS)
+
 @api_bp.route('/gofile/server', methods=['GET'])
 def get_server():
     """Get the best Gofile server for uploads."""
@@ -34,6 +46,46 @@ def get_server():
             'message': str(e)
         }), 500
 
+@api_bp.route('/storage/upload', methods=['POST'])
+def upload_input():
+    """
+    Store an input file in the local storage backend, which the browser cannot reach.
+    
+    Other backends are uploaded to from the browser directly; this endpoint
+    is not available for them, so anonymous callers cannot upload through
+    the server's credentials (e.g. GOFILE_API_TOKEN).
+    """
+    storage = get_storage()
+    if not isinstance(storage, LocalStorage):
+        return jsonify({
+            'status': 'error',
+            'message': 'Not found'
+        }), 404
+    
+    try:
+        file = request.files.get('file')
+        if not file or file.filename == '':
+            return jsonify({
+                'status': 'error',
+                'message': 'No file provided'
+            }), 400
+        
+        result = storage.upload(file.stream, file.filename)
+        
+        return jsonify({
+            'status': 'success',
+            'fileId': result['fileId'],
+            'fileName': result['fileName'],
+            'downloadPage': result['downloadPage']
+        })
+        
+    except Exception as e:
+        logger.error(f"Error storing file: {str(e)}")
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 500
+
 @api_bp.route('/task', methods=['POST'])
 def create_task():
     """Create a new subtitle generation task."""
@@ -66,6 +118,21 @@ def create_task():
         # Get output language (optional field)
         output_language = data.get('output_language', 'same')
         
+        # One or more output formats, all rendered from a single transcription
+        formats = data['format'] if isinstance(data['format'], list) else [data['format']]
+        if not all(isinstance(format_type, str) for format_type in formats):
+            return jsonify({
+                'status': 'error',
+                'message': 'format must be a format name or a list of format names'
+            }), 400
+        formats = list(dict.fromkeys(formats))
+        unsupported = [format_type for format_type in formats if format_type not in Config.SUBTITLE_FORMATS]
+        if not formats or unsupported:
+            return jsonify({
+                'status': 'error',
+                'message': f"Unsupported format: {', '.join(map(str, unsupported)) or 'none given'}"
+            }), 400
+        
         # Create a new task
         task = SubtitleTask(
             task_id=task_id,
@@ -77,7 +144,8 @@ def create_task():
             language=data['language'],
             output_language=output_language,
             model=data['model'],
-            format_type=data['format'],
+            format_type=formats[0],
+            formats=','.join(formats),
             created_at=datetime.utcnow()
         )
         
@@ -87,8 +155,8 @@ def create_task():
         # Store the task ID in the session
         session['last_task_id'] = task_id
         
-        # Start the subtitle generation task
-        generate_subtitles.delay(task_id)
+        # Start subtitle generation; transcription runs on a worker that keeps the model warm
+        start_pipeline(task)
         
         return jsonify({
             'status': 'success',
@@ -103,45 +171,342 @@ def create_task():
             'message': str(e)
         }), 500
 
+def task_etag(updated_at, status, fields):
+    """Return the ETag of a task representation: its version plus the requested projection."""
+    version = f"{updated_at.isoformat() if updated_at else ''}|{status}|{','.join(fields or [])}"
+    return hashlib.sha1(version.encode('utf-8')).hexdigest()[:20]
+
 @api_bp.route('/task/<task_id>', methods=['GET'])
 def get_task(task_id):
-    """Get the status of a specific task."""
+    """
+    Get the status of a specific task.
+    
+    `fields` (comma-separated) limits the response to those fields of the
+    task. Responses carry an ETag and Last-Modified derived from the task's
+    updated_at and status; a conditional request for an unchanged task gets
+    a 304, found with a lookup of those two columns only.
+    """
     try:
-        task = SubtitleTask.query.filter_by(task_id=task_id).first()
+        fields = [field for field in request.args.get('fields', '').split(',') if field] or None
+        if fields:
+            unknown = sorted(set(fields) - set(SubtitleTask.TASK_FIELDS))
+            if unknown:
+                return jsonify({
+                    'status': 'error',
+                    'message': f"Unknown fields: {', '.join(unknown)}"
+                }), 400
+        
+        version = db.session.query(SubtitleTask.updated_at, SubtitleTask.status).filter_by(task_id=task_id).first()
         
-        if not task:
+        if not version:
             return jsonify({
                 'status': 'error',
                 'message': 'Task not found'
             }), 404
         
+        etag = task_etag(version.updated_at, version.status, fields)
+        last_modified = version.updated_at.replace(tzinfo=timezone.utc, microsecond=0) if version.updated_at else None
+        if request.if_none_match:
+            not_modified = request.if_none_match.contains(etag)
+        else:
+            not_modified = bool(last_modified and request.if_modified_since and last_modified <= request.if_modified_since)
+        
+        if not_modified:
+            response = Response(status=304)
+        else:
+            if fields and set(fields) <= set(SubtitleTask.STATUS_FIELDS):
+                # Compact fields come straight from their columns
+                row = db.session.query(*(getattr(SubtitleTask, field) for field in SubtitleTask.STATUS_FIELDS)).filter_by(task_id=task_id).first()
+                task_data = status_dict(row)
+            else:
+                task_data = SubtitleTask.query.filter_by(task_id=task_id).first().to_dict()
+            if fields:
+                task_data = {field: task_data[field] for field in fields}
+            response = jsonify({
+                'status': 'success',
+                'task': task_data
+            })
+        
+        response.set_etag(etag)
+        if last_modified:
+            response.last_modified = last_modified
+        # Cached copies may be reused, but only after revalidating
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+        
+    except Exception as e:
+        logger.error(f"Error getting task: {str(e)}")
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 500
+
+def parse_since(value):
+    """Parse a `since` timestamp (ISO 8601 in UTC, or Unix seconds) into a naive UTC datetime."""
+    if value is None or value == '':
+        return None
+    if isinstance(value, (int, float)) or str(value).replace('.', '', 1).isdigit():
+        return datetime.utcfromtimestamp(float(value))
+    since = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    if since.tzinfo is not None:
+        since = since.astimezone(timezone.utc).replace(tzinfo=None)
+    return since
+
+@api_bp.route('/tasks/status', methods=['GET', 'POST'])
+def get_tasks_status():
+    """
+    Get the compact status of many tasks in one request.
+    
+    Takes task IDs as `ids` (comma-separated query parameter, or a list in a
+    JSON body) and an optional `since` timestamp; only tasks updated after
+    `since` are returned. Pass the returned `since` back on the next call to
+    get only what changed in between. The returned `since` trails the query
+    by STATUS_SINCE_OVERLAP_SECONDS, so that rows committed late are not
+    missed; a task can therefore be returned again unchanged, and clients
+    skip those by comparing `updated_at`.
+    """
+    try:
+        if request.method == 'POST':
+            data = request.get_json(silent=True) or {}
+            task_ids = data.get('ids', [])
+            since_value = data.get('since')
+        else:
+            task_ids = request.args.get('ids', '').split(',')
+            since_value = request.args.get('since')
+        
+        if not isinstance(task_ids, list) or not all(isinstance(task_id, str) for task_id in task_ids):
+            return jsonify({
+                'status': 'error',
+                'message': 'ids must be a list of task IDs'
+            }), 400
+        task_ids = list(dict.fromkeys(task_id.strip() for task_id in task_ids if task_id.strip()))
+        if len(task_ids) > Config.STATUS_BATCH_MAX_IDS:
+            return jsonify({
+                'status': 'error',
+                'message': f"At most {Config.STATUS_BATCH_MAX_IDS} task IDs per request"
+            }), 400
+        
+        try:
+            since = parse_since(since_value)
+        except (TypeError, ValueError, OverflowError):
+            return jsonify({
+                'status': 'error',
+                'message': 'since must be an ISO 8601 timestamp or Unix time'
+            }), 400
+        
+        # Taken before the query, so the cursor never passes a row it did not see
+        queried_at = datetime.utcnow()
+        rows = []
+        if task_ids:
+            # One IN query over the status columns only, without loading full rows
+            query = db.session.query(*(getattr(SubtitleTask, field) for field in SubtitleTask.STATUS_FIELDS))
+            query = query.filter(SubtitleTask.task_id.in_(task_ids))
+            if since is not None:
+                query = query.filter(SubtitleTask.updated_at > since)
+            rows = query.all()
+        
+        tasks = [status_dict(row) for row in rows]
+        next_since = queried_at - timedelta(seconds=Config.STATUS_SINCE_OVERLAP_SECONDS)
+        if since is not None:
+            next_since = max(next_since, since)
+        
         return jsonify({
             'status': 'success',
-            'task': task.to_dict()
+            'tasks': tasks,
+            'since': next_since.isoformat()
         })
         
     except Exception as e:
-        logger.error(f"Error getting task: {str(e)}")
+        logger.error(f"Error getting task statuses: {str(e)}")
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 500
+
+@api_bp.route('/task/<task_id>/events', methods=['GET'])
+def get_task_events(task_id):
+    """
+    Stream the status of a task as Server-Sent Events.
+    
+    The first event is the current state (from the last published snapshot,
+    or the database if there is none); after that, events come from Redis
+    pub/sub as the worker updates the task, with no database queries. The
+    stream ends once the task completes or fails, or after
+    TASK_EVENTS_MAX_SECONDS (EventSource then reconnects). Returns 503 when
+    Redis is unavailable or TASK_EVENTS_MAX_STREAMS streams are already open,
+    so clients fall back to polling /api/task/<id>.
+    """
+    if not _event_streams.acquire(blocking=False):
+        return jsonify({
+            'status': 'error',
+            'message': 'Too many task event streams'
+        }), 503
+    
+    pubsub = None
+    closed = False
+    
+    def close():
+        nonlocal closed
+        if closed:
+            return
+        closed = True
+        if pubsub is not None:
+            pubsub.close()
+        _event_streams.release()
+    
+    try:
+        # Subscribe before reading the current state, so no update falls in between
+        pubsub = task_events.subscribe(task_id)
+        snapshot = task_events.get_snapshot(task_id)
+    except Exception as e:
+        logger.error(f"Error subscribing to task events: {str(e)}")
+        close()
+        return jsonify({
+            'status': 'error',
+            'message': 'Task events are not available'
+        }), 503
+    
+    if snapshot is None:
+        try:
+            task = SubtitleTask.query.filter_by(task_id=task_id).first()
+            snapshot = task.to_dict() if task else None
+        except Exception:
+            close()
+            raise
+        finally:
+            # Give the connection back now instead of when the stream ends
+            db.session.remove()
+        if snapshot is None:
+            close()
+            return jsonify({
+                'status': 'error',
+                'message': 'Task not found'
+            }), 404
+    
+    def stream():
+        try:
+            yield task_events.format_sse(snapshot)
+            if snapshot.get('status') in task_events.TERMINAL_STATUSES:
+                return
+            for event in task_events.iter_events(pubsub):
+                yield task_events.format_sse(event)
+        finally:
+            close()
+    
+    response = Response(stream(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+    # Also runs when the client goes away before the stream starts
+    response.call_on_close(close)
+    return response
+
+SUBTITLE_MIMETYPES = {
+    'srt': 'application/x-subrip',
+    'vtt': 'text/vtt',
+    'txt': 'text/plain',
+    'json': 'application/json',
+}
+
+@api_bp.route('/task/<task_id>/subtitles/<format_type>', methods=['GET'])
+def get_task_subtitles(task_id, format_type):
+    """Render the stored segments of a task in any subtitle format."""
+    try:
+        if format_type not in Config.SUBTITLE_FORMATS:
+            return jsonify({
+                'status': 'error',
+                'message': f'Unsupported format: {format_type}'
+            }), 400
+        
+        row = db.session.query(SubtitleTask.segments_data, SubtitleTask.original_filename).filter(
+            SubtitleTask.task_id == task_id
+        ).first()
+        
+        if not row:
+            return jsonify({
+                'status': 'error',
+                'message': 'Task not found'
+            }), 404
+        
+        segments = unpack_segments(row.segments_data)
+        if segments is None:
+            return jsonify({
+                'status': 'error',
+                'message': 'Subtitles are not available for this task'
+            }), 404
+        
+        response = Response(
+            (piece.encode('utf-8') for piece in render_subtitles(segments, format_type)),
+            mimetype=SUBTITLE_MIMETYPES[format_type]
+        )
+        response.headers.set('Content-Disposition', 'attachment',
+                             filename=f"{os.path.splitext(row.original_filename)[0]}.{format_type}")
+        return response
+        
+    except Exception as e:
+        logger.error(f"Error rendering subtitles: {str(e)}")
         return jsonify({
             'status': 'error',
             'message': str(e)
         }), 500
 
+def encode_cursor(created_at, row_id):
+    """Return the opaque cursor of a position in the task list."""
+    return base64.urlsafe_b64encode(f"{created_at.isoformat()}|{row_id}".encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor):
+    """Return the (created_at, id) position of a cursor made by encode_cursor."""
+    created_at, row_id = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8').split('|')
+    return datetime.fromisoformat(created_at), int(row_id)
+
 @api_bp.route('/my-tasks', methods=['GET'])
 def get_my_tasks():
-    """Get all tasks for the current session."""
+    """
+    Get the tasks of the current session, newest first, one page at a time.
+    
+    Takes an optional `limit` (capped at MY_TASKS_MAX_PAGE_SIZE) and the
+    `cursor` returned with the previous page; `next_cursor` is null on the
+    last page. Pages are read by keyset over the (session_id, created_at)
+    index, so a page costs the same however deep it is.
+    """
     try:
         if 'session_id' not in session:
             return jsonify({
                 'status': 'success',
-                'tasks': []
+                'tasks': [],
+                'next_cursor': None
             })
         
-        tasks = SubtitleTask.query.filter_by(session_id=session['session_id']).order_by(SubtitleTask.created_at.desc()).all()
+        try:
+            limit = min(max(int(request.args.get('limit', Config.MY_TASKS_PAGE_SIZE)), 1), Config.MY_TASKS_MAX_PAGE_SIZE)
+            cursor = request.args.get('cursor')
+            position = decode_cursor(cursor) if cursor else None
+        except (TypeError, ValueError, UnicodeDecodeError):
+            return jsonify({
+                'status': 'error',
+                'message': 'Invalid limit or cursor'
+            }), 400
+        
+        query = db.session.query(*(getattr(SubtitleTask, field) for field in SubtitleTask.LIST_FIELDS))
+        query = query.filter(SubtitleTask.session_id == session['session_id'])
+        if position:
+            created_at, row_id = position
+            query = query.filter(or_(
+                SubtitleTask.created_at < created_at,
+                and_(SubtitleTask.created_at == created_at, SubtitleTask.id < row_id)
+            ))
+        # One row more than the page tells whether there is a next page
+        rows = query.order_by(SubtitleTask.created_at.desc(), SubtitleTask.id.desc()).limit(limit + 1).all()
+        
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1].created_at, rows[-1].id)
         
         return jsonify({
             'status': 'success',
-            'tasks': [task.to_dict() for task in tasks]
+            'tasks': [list_dict(row) for row in rows],
+            'next_cursor': next_cursor
         })
         
     except Exception as e:
@@ -150,3 +515,32 @@ def get_my_tasks():
             'status': 'error',
             'message': str(e)
         }), 500
+
+@api_bp.route('/cache/stats', methods=['GET'])
+def get_cache_stats():
+    """
+    Get transcription cache hit rate and savings.
+    
+    The counters are those of every worker, kept in Redis; returns 503 when
+    they cannot be read.
+    """
+    cache = get_cache()
+    if not cache:
+        return jsonify({
+            'status': 'success',
+            'enabled': False
+        })
+    
+    stats = cache.stats()
+    if stats is None:
+        return jsonify({
+            'status': 'error',
+            'enabled': True,
+            'message': 'Cache statistics are not available'
+        }), 503
+    
+    return jsonify({
+        'status': 'success',
+        'enabled': True,
+        'stats': stats
+    })
@@ -1,15 +1,13 @@
 import os
 import logging
 from flask import Flask
-from flask_sqlalchemy import SQLAlchemy
+# The extension lives in database.py so models import without the app
+from database import db, create_schema
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
-# Initialize SQLAlchemy
-db = SQLAlchemy()
-
 def create_app():
     app = Flask(__name__)
     
@@ -20,10 +18,10 @@ def create_app():
     # Initialize extensions
     db.init_app(app)
     
-    # Create database tables
+    # Create database tables, and add columns and indexes missing from existing ones
     with app.app_context():
         from models import SubtitleTask  # Import here to avoid circular imports
-        db.create_all()
+        create_schema(db.engine, db.metadata)
     
     # Register blueprints - moved after db initialization to avoid circular imports
     from routes import main_bp
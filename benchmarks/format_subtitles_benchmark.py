@@ -0,0 +1,78 @@
+"""
+Benchmark subtitle rendering on a large synthetic transcript.
+
+Compares format_subtitles (batched NumPy timestamp formatting and bulk
+writes) against a per-segment reference renderer, and checks that both
+produce byte-identical SRT and VTT output.
+
+Usage: python benchmarks/format_subtitles_benchmark.py [segment_count]
+"""
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from whisper_subtitler import format_subtitles, format_timestamp
+
+
+def make_segments(count, seed=0):
+    """Build `count` back-to-back segments with realistic durations and text."""
+    rng = random.Random(seed)
+    words = ['the', 'model', 'audio', 'subtitle', 'speaker', 'lecture', 'question', 'answer', 'today', 'results']
+    segments = []
+    time_cursor = 0.0
+    for i in range(count):
+        duration = rng.uniform(0.5, 6.0)
+        text = ' ' + ' '.join(rng.choice(words) for _ in range(rng.randint(3, 14)))
+        segments.append({'id': i, 'start': time_cursor, 'end': time_cursor + duration, 'text': text})
+        time_cursor += duration + rng.uniform(0.0, 1.0)
+    return segments
+
+
+def render_reference(segments, format_type):
+    """Per-segment renderer: one format_timestamp call and one write per field."""
+    pieces = []
+    if format_type == 'vtt':
+        pieces.append("WEBVTT\n\n")
+    for i, segment in enumerate(segments, 1):
+        start_time = format_timestamp(segment['start'], vtt=format_type == 'vtt')
+        end_time = format_timestamp(segment['end'], vtt=format_type == 'vtt')
+        pieces.append(f"{i}\n")
+        pieces.append(f"{start_time} --> {end_time}\n")
+        pieces.append(f"{segment['text'].strip()}\n\n")
+    return ''.join(pieces).encode('utf-8')
+
+
+def best_of(repeats, function, *args):
+    """Return the fastest wall-clock time of `repeats` calls, and the last result."""
+    best = float('inf')
+    result = None
+    for _ in range(repeats):
+        started = time.perf_counter()
+        result = function(*args)
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    segments = make_segments(count)
+    transcription = {'segments': segments}
+    print(f"Rendering {count} segments")
+
+    for format_type in ('srt', 'vtt'):
+        reference_time, reference = best_of(3, render_reference, segments, format_type)
+        batched_time, buffer = best_of(3, format_subtitles, transcription, format_type)
+        identical = buffer.getvalue() == reference
+        print(f"{format_type}: reference {reference_time * 1000:.1f} ms, "
+              f"format_subtitles {batched_time * 1000:.1f} ms "
+              f"({reference_time / batched_time:.1f}x), "
+              f"{len(reference) / 1e6:.1f} MB, identical={identical}")
+        if not identical:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
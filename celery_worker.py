@@ -1,12 +1,18 @@
 import os
+import shutil
 import tempfile
 import time
 import logging
 import uuid
+import random
+import contextlib
 import datetime
-import requests
-from celery import Celery
-from celery.signals import task_prerun, task_postrun, task_failure
+import threading
+import numpy as np
+from celery import Celery, chain, chord
+from celery.exceptions import TaskPredicate
+from celery.signals import (task_prerun, task_postrun, task_failure, worker_init, worker_process_init,
+                            worker_ready, celeryd_after_setup)
 import config
 
 # Configure logging
@@ -24,148 +30,808 @@ celery_app.conf.update(
     result_serializer='json',
     timezone='UTC',
     enable_utc=True,
+    task_default_queue=config.Config.CELERY_SHARED_QUEUE,
 )
 
 # These imports need to be after celery_app creation to avoid circular imports
 from models import SubtitleTask
-from whisper_subtitler import process_file
-from gofile_api import upload_to_gofile
+from whisper_subtitler import (SAMPLE_RATE, decode_audio, decode_audio_stream, transcribe_samples, build_transcription_options,
+                               detect_language, split_audio, stitch_segments, apply_vad, remap_segments,
+                               format_subtitles)
+from downloader import DownloadStats
+from errors import TransientError
+from storage import get_storage
+from gofile_api import add_to_account, set_account_dispatcher
+from model_registry import get_model, get_registry, get_memory_sharing
+from transcription_cache import TranscriptionCache, get_cache
+from task_events import publish_task_commits
+import task_state
+from database import session_scope, configure_worker_pool, dispose_engine, get_engine, create_schema
 
-# We'll use a function to get the app and db when needed
-def get_app_context():
-    from app import app, db
-    return app, db
+def queue_name_for_model(model_name):
+    """Return the name of the dedicated queue for a Whisper model."""
+    return f"{config.Config.CELERY_MODEL_QUEUE_PREFIX}{model_name}"
+
+# Workers advertise the queues they consume in this Redis sorted set, scored
+# by when the entry expires
+QUEUE_REGISTRY_KEY = 'celery:consumed-queues'
+
+_queue_registry = None
+_queue_discovery = {'queues': set(), 'expires': 0.0}
+_queue_discovery_lock = threading.Lock()
+
+def get_queue_registry():
+    """Return the Redis client holding the queues advertised by the workers."""
+    global _queue_registry
+    if _queue_registry is None:
+        import redis
+        _queue_registry = redis.Redis.from_url(config.Config.CELERY_BROKER_URL,
+                                               socket_connect_timeout=1, socket_timeout=1)
+    return _queue_registry
+
+def advertise_queues(queues):
+    """Record that a live worker consumes `queues`, for three discovery periods."""
+    now = time.time()
+    expires = now + 3 * config.Config.CELERY_QUEUE_DISCOVERY_TTL
+    pipeline = get_queue_registry().pipeline()
+    pipeline.zadd(QUEUE_REGISTRY_KEY, {queue: expires for queue in queues})
+    # Drop queues no worker has advertised for a while
+    pipeline.zremrangebyscore(QUEUE_REGISTRY_KEY, '-inf', now)
+    pipeline.execute()
+
+def get_consumed_queues():
+    """
+    Return the names of the queues that live workers currently consume.
+
+    Workers advertise their queues in Redis (see advertise_queues_handler);
+    the answer is cached for CELERY_QUEUE_DISCOVERY_TTL seconds.
+    """
+    with _queue_discovery_lock:
+        if time.monotonic() < _queue_discovery['expires']:
+            return _queue_discovery['queues']
+
+        queues = set()
+        try:
+            queues = {
+                queue.decode('utf-8')
+                for queue in get_queue_registry().zrangebyscore(QUEUE_REGISTRY_KEY, time.time(), '+inf')
+            }
+        except Exception as e:
+            logger.warning(f"Could not discover worker queues: {str(e)}")
+
+        _queue_discovery['queues'] = queues
+        _queue_discovery['expires'] = time.monotonic() + config.Config.CELERY_QUEUE_DISCOVERY_TTL
+        return queues
+
+def fallback_queue():
+    """
+    Return the queue for tasks any worker can run.
+
+    That is the shared queue, unless every worker consumes only model
+    queues; then it is one of those, so the task still runs.
+    """
+    queues = get_consumed_queues()
+    if not queues or config.Config.CELERY_SHARED_QUEUE in queues:
+        return config.Config.CELERY_SHARED_QUEUE
+    return sorted(queues)[0]
+
+def queue_for_model(model_name):
+    """
+    Pick the queue for a task using `model_name`.
+
+    Tasks go to the model's dedicated queue when some worker consumes it, so
+    they land on a worker that keeps the model warm; otherwise they go to the
+    fallback queue.
+    """
+    queue = queue_name_for_model(model_name)
+    if queue in get_consumed_queues():
+        return queue
+    return fallback_queue()
+
+def io_queue():
+    """Return the I/O queue if some worker consumes it, otherwise the fallback queue."""
+    if config.Config.CELERY_IO_QUEUE in get_consumed_queues():
+        return config.Config.CELERY_IO_QUEUE
+    return fallback_queue()
+
+def staged_pipeline_enabled():
+    """
+    Return True if tasks run as the staged pipeline.
+
+    The stages hand the input over in CHUNK_STORAGE_DIR, which the I/O and
+    model workers must share, so the pipeline stays off until that directory
+    is configured explicitly.
+    """
+    if not config.Config.CELERY_STAGED_PIPELINE:
+        return False
+    if not config.Config.CHUNK_STORAGE_DIR_CONFIGURED:
+        logger.warning("CELERY_STAGED_PIPELINE needs CHUNK_STORAGE_DIR set to a directory shared by "
+                       "every worker; running tasks with generate_subtitles instead")
+        return False
+    return True
+
+def start_pipeline(task):
+    """
+    Start generating subtitles for a SubtitleTask.
+
+    With CELERY_STAGED_PIPELINE the work runs as a chain of stage tasks:
+    download, upload and notify on the I/O queue, and decoding and
+    transcription on the model's queue. Otherwise generate_subtitles does
+    everything on the model's queue.
+    """
+    model_queue = queue_for_model(task.model)
+    if not staged_pipeline_enabled():
+        return generate_subtitles.apply_async(args=[task.task_id], queue=model_queue)
+
+    queue = io_queue()
+    return chain(
+        download_stage.si(task.task_id).set(queue=queue),
+        transcribe_stage.s().set(queue=model_queue),
+        upload_stage.s().set(queue=queue),
+        notify_stage.s().set(queue=queue),
+    ).apply_async()
+
+@celeryd_after_setup.connect
+def select_worker_queues_handler(sender, instance, **kwargs):
+    """Consume only the queues of the models in WHISPER_WORKER_MODELS, if set."""
+    model_names = [name for name in config.Config.WHISPER_WORKER_MODELS if name in config.Config.WHISPER_MODELS]
+    if not model_names:
+        return
+    queues = [queue_name_for_model(name) for name in model_names]
+    if config.Config.WHISPER_WORKER_CONSUME_SHARED:
+        queues.append(config.Config.CELERY_SHARED_QUEUE)
+    instance.app.amqp.queues.select(queues)
+    logger.info(f"Worker {sender} consuming queues: {', '.join(queues)}")
+
+@worker_ready.connect
+def advertise_queues_handler(sender=None, **kwargs):
+    """Advertise the queues this worker consumes until it exits, so senders can route to them."""
+    task_consumer = getattr(sender, 'task_consumer', None)
+    if task_consumer is not None:
+        queues = [queue.name for queue in task_consumer.queues]
+    else:
+        queues = list(celery_app.amqp.queues.consume_from or celery_app.amqp.queues)
+
+    def advertise():
+        while True:
+            try:
+                advertise_queues(queues)
+            except Exception as e:
+                logger.warning(f"Could not advertise worker queues: {str(e)}")
+            time.sleep(config.Config.CELERY_QUEUE_DISCOVERY_TTL)
+
+    threading.Thread(target=advertise, name='queue-advertiser', daemon=True).start()
+    logger.info(f"Advertising worker queues: {', '.join(queues)}")
+
+def get_preload_models():
+    """Return the configured models to load before the pool forks."""
+    requested = config.Config.WHISPER_PRELOAD_MODELS or config.Config.WHISPER_WORKER_MODELS
+    if 'all' in requested:
+        return list(config.Config.WHISPER_MODELS)
+    unknown = [name for name in requested if name not in config.Config.WHISPER_MODELS]
+    if unknown:
+        logger.warning(f"Ignoring unknown Whisper models: {', '.join(unknown)}")
+    return [name for name in requested if name in config.Config.WHISPER_MODELS]
+
+def format_memory_sharing(report):
+    """Format a memory sharing report for the logs."""
+    return ' '.join(
+        f"{name}={report.get(f'{name}_bytes', 0) / (1024 * 1024):.1f}MB"
+        for name in ('rss', 'pss', 'shared', 'private')
+    )
+
+def worker_pool_name(pool_cls):
+    """Return the name of a Celery execution pool ('prefork', 'threads', 'gevent', ...)."""
+    if isinstance(pool_cls, str):
+        return pool_cls.rsplit(':', 1)[0].rsplit('.', 1)[-1]
+    return pool_cls.__module__.rsplit('.', 1)[-1]
+
+@worker_init.connect
+def database_init_handler(sender=None, **kwargs):
+    """Size the database pool for this worker and make sure the tables are up to date."""
+    configure_worker_pool(getattr(sender, 'concurrency', 1) or 1,
+                          worker_pool_name(getattr(sender, 'pool_cls', 'prefork')))
+    create_schema(get_engine(), SubtitleTask.metadata)
+
+@worker_init.connect
+def task_events_init_handler(**kwargs):
+    """Publish every committed change to a SubtitleTask to its event stream (worker processes only)."""
+    if config.Config.TASK_EVENTS_ENABLED:
+        publish_task_commits()
+
+@worker_init.connect
+def preload_models_handler(**kwargs):
+    """Load the configured Whisper models in the parent before the pool forks."""
+    model_names = get_preload_models()
+    if not model_names:
+        return
+    logger.info(f"Preloading Whisper models before fork: {', '.join(model_names)}")
+    get_registry().preload(model_names)
+    report = get_memory_sharing()
+    if report:
+        logger.info(f"Parent memory after preload: {format_memory_sharing(report)}")
+
+@worker_process_init.connect
+def worker_process_init_handler(**kwargs):
+    """Report how much memory the new pool child shares with the parent."""
+    # Connections opened by the parent must not be shared with the child
+    dispose_engine()
+    registry = get_registry()
+    report = get_memory_sharing()
+    if registry.loaded_models() and report:
+        logger.info(f"Child {os.getpid()} started with models {registry.loaded_models()}: "
+                    f"{format_memory_sharing(report)}")
+
+@task_postrun.connect
+def report_memory_sharing_handler(*args, **kwargs):
+    """Report shared versus private memory of the pool child after each task."""
+    report = get_memory_sharing()
+    if report:
+        logger.info(f"Child {os.getpid()} memory after task: {format_memory_sharing(report)}; "
+                    f"model registry: {get_registry().stats()}")
+    logger.debug(f"Child {os.getpid()} task state transitions: {task_state.stats()}")
+
+# Tasks whose failure fails the SubtitleTask, with how to find its ID in their arguments
+PIPELINE_TASKS = {
+    'generate_subtitles': lambda args: args[0],
+    'download_stage': lambda args: args[0],
+    'transcribe_stage': lambda args: args[0]['task_id'],
+    'upload_stage': lambda args: args[0]['task_id'],
+    'notify_stage': lambda args: args[0]['task_id'],
+    'stitch_subtitles': lambda args: args[1],
+}
+
+# Tasks that start a SubtitleTask
+STARTING_TASKS = {'generate_subtitles', 'download_stage'}
 
 @task_prerun.connect
 def task_prerun_handler(task_id, task, *args, **kwargs):
     """Update task status when task starts."""
-    app, db = get_app_context()
-    with app.app_context():
-        # Find the task in DB by task ID
-        db_task = SubtitleTask.query.filter_by(task_id=kwargs.get('args', [''])[0]).first()
-        if db_task:
-            db_task.celery_status = 'STARTED'
-            db_task.progress = 'Task started'
-            db.session.commit()
-
-@task_postrun.connect
-def task_postrun_handler(task_id, task, retval, state, *args, **kwargs):
-    """Update task status when task completes."""
-    app, db = get_app_context()
-    with app.app_context():
-        # Find the task in DB by task ID
-        db_task = SubtitleTask.query.filter_by(task_id=kwargs.get('args', [''])[0]).first()
-        if db_task and state == 'SUCCESS':
-            db_task.status = 'completed'
-            db_task.celery_status = 'SUCCESS'
-            db_task.progress = 'Task completed successfully'
-            db_task.completed_at = datetime.datetime.utcnow()
-            db.session.commit()
+    if task.name not in STARTING_TASKS:
+        return
+    task_state.start(kwargs.get('args', [''])[0])
 
 @task_failure.connect
 def task_failure_handler(task_id, exception, args, kwargs, traceback, einfo, *args_, **kwargs_):
-    """Update task status when task fails."""
-    app, db = get_app_context()
-    with app.app_context():
-        # Find the task in DB by task ID
-        db_task = SubtitleTask.query.filter_by(task_id=args[0]).first()
-        if db_task:
-            db_task.status = 'failed'
-            db_task.celery_status = 'FAILURE'
-            db_task.message = str(exception)
-            db_task.progress = f'Task failed: {str(exception)}'
-            db.session.commit()
+    """Fail the subtitle task when one of its tasks fails for good, and drop its artifacts."""
+    sender = kwargs_.get('sender')
+    if sender is None or sender.name not in PIPELINE_TASKS:
+        return
+    subtitle_task_id = PIPELINE_TASKS[sender.name](args)
+    task_state.fail(subtitle_task_id, exception)
+    shutil.rmtree(os.path.join(config.Config.CHUNK_STORAGE_DIR, subtitle_task_id), ignore_errors=True)
+
+def should_distribute(audio):
+    """Return True if the audio is long enough to fan out across the cluster."""
+    threshold = config.Config.WHISPER_DISTRIBUTED_SECONDS
+    return bool(threshold) and len(audio) / SAMPLE_RATE > threshold
+
+def save_chunk(path, samples):
+    """Write chunk samples to `path` as 16-bit PCM (lossless for decoded audio)."""
+    np.save(path, np.round(samples * 32768.0).clip(-32768, 32767).astype(np.int16))
+
+def load_chunk(path):
+    """Read chunk samples written by save_chunk as float32."""
+    samples = np.load(path).astype(np.float32)
+    samples *= 1.0 / 32768.0
+    return samples
+
+def transcription_cache_key(task, audio):
+    """Return the transcription cache key for a task's decoded audio."""
+    transcription_options = build_transcription_options(task.language, task.output_language)
+    return TranscriptionCache.make_key(
+        audio,
+        model=task.model,
+        language=task.language,
+        task=transcription_options.get('task', 'transcribe'),
+        output_language=task.output_language,
+        vad=config.Config.WHISPER_VAD_ENABLED
+    )
+
+def build_chunk_chord(task, audio, regions=None, cache_key=None, upload=True, started=None):
+    """
+    Split the audio and return (chord, chunk count) fanning the chunks out to the cluster.
+
+    Chunks are written to CHUNK_STORAGE_DIR, which every worker must be able
+    to read; only their paths travel through the broker. The stitch_subtitles
+    callback merges the segments and, with `upload`, completes the task.
+    `regions` are the VAD speech regions the audio was cut from, if VAD ran.
+    `started` is when the transcribe stage started, for its stage timing.
+    """
+    chunk_dir = os.path.join(config.Config.CHUNK_STORAGE_DIR, task.task_id)
+    os.makedirs(chunk_dir, exist_ok=True)
+    if regions is not None:
+        np.save(os.path.join(chunk_dir, 'regions.npy'), regions)
+
+    transcription_options = build_transcription_options(task.language, task.output_language)
+    if transcription_options.get('language', 'auto') == 'auto':
+        # Every chunk must be decoded with the same language
+        transcription_options['language'] = detect_language(audio, task.model)
+
+    chunks = split_audio(audio, config.Config.WHISPER_CHUNK_MIN_SECONDS, config.Config.WHISPER_CHUNK_MAX_SECONDS)
+    queue = queue_for_model(task.model)
+    header = []
+    spans = []
+    for index, (offset, samples) in enumerate(chunks):
+        chunk_path = os.path.join(chunk_dir, f"{index:05d}.npy")
+        save_chunk(chunk_path, samples)
+        header.append(transcribe_chunk.si(chunk_path, task.model, transcription_options).set(queue=queue))
+        spans.append((offset, len(samples) / SAMPLE_RATE))
+
+    callback = stitch_subtitles.s(task.task_id, spans, transcription_options['language'],
+                                  cache_key, upload=upload, started=started).set(queue=queue)
+    # Sent to the model queue too: model-only workers may not consume the shared queue
+    callback.link_error(chunks_failed.s(task.task_id).set(queue=queue))
+    logger.info(f"Split task {task.task_id} into {len(chunks)} chunks for queue {queue}")
+    return chord(header, callback), len(chunks)
+
+def dispatch_chunks(task, audio, regions=None, cache_key=None):
+    """Fan the audio out to the cluster (see build_chunk_chord); stitch_subtitles completes the task."""
+    signature, chunk_count = build_chunk_chord(task, audio, regions, cache_key)
+    signature.apply_async()
+    return chunk_count
+
+def store_transcription(task, transcription):
+    """Keep the segments and audio statistics of a transcription on the task."""
+    task.audio_duration = transcription.get('audio_seconds')
+    task.skipped_audio_seconds = transcription.get('skipped_seconds')
+    # Keep the segments so any other format can be rendered later without re-transcribing
+    task.set_segments(transcription['segments'])
+
+def upload_subtitles(task, transcription):
+    """
+    Render every requested format of a transcription and upload them.
+
+    Returns the result columns for task_state.complete: the uploaded files
+    by format ('outputs') and the links of the first format.
+    """
+    # Render every requested format from the same segments, in memory
+    base_name = os.path.splitext(task.original_filename)[0]
+    formats = task.get_formats()
+    subtitle_files = [
+        (format_subtitles(transcription, format_type), f"{base_name}.{format_type}")
+        for format_type in formats
+    ]
+
+    task_state.progress(task.task_id, 'UPLOADING',
+                        'Uploading subtitle files...' if len(subtitle_files) > 1 else 'Uploading subtitle file...')
+
+    upload_results = get_storage().upload_many(subtitle_files)
+
+    return {
+        'outputs': {
+            format_type: {
+                'fileId': upload_result['fileId'],
+                'link': upload_result['downloadPage'],
+                'filename': subtitle_filename
+            }
+            for format_type, (_, subtitle_filename), upload_result
+            in zip(formats, subtitle_files, upload_results)
+        },
+        'subtitle_gofile_id': upload_results[0]['fileId'],
+        'subtitle_gofile_link': upload_results[0]['downloadPage'],
+        'subtitle_filename': subtitle_files[0][1],
+    }
+
+def complete_with_subtitles(task, transcription, session):
+    """Format and upload the subtitles for a transcription, then mark the task completed."""
+    store_transcription(task, transcription)
+    # Commit the segments before uploading, so a retry can resume from them
+    session.commit()
+    results = upload_subtitles(task, transcription)
+    task_state.complete(task.task_id, **results)
+    return {
+        'status': 'success',
+        'task_id': task.task_id,
+        'subtitle_gofile_link': results['subtitle_gofile_link']
+    }
+
+def stored_transcription(task):
+    """
+    Return the transcription already stored on the task, or None.
+    
+    Segments are stored before the upload starts, so a task retried after a
+    failed upload resumes from there instead of downloading and transcribing
+    again.
+    """
+    if task.segment_count is None:
+        return None
+    return {
+        'segments': task.get_segments(),
+        'audio_seconds': task.audio_duration,
+        'skipped_seconds': task.skipped_audio_seconds,
+    }
+
+def retry_countdown(retries, error=None):
+    """Seconds to wait before retry number `retries` + 1: exponential backoff with jitter."""
+    if getattr(error, 'retry_after', None):
+        return error.retry_after
+    delay = min(config.Config.TASK_RETRY_BACKOFF_MAX, config.Config.TASK_RETRY_BACKOFF * 2 ** retries)
+    return random.uniform(delay / 2, delay)
+
+def retry_later(task, task_id, error):
+    """
+    Schedule a retry of `task` after a transient failure.
+    
+    Raises celery.exceptions.Retry, which frees the worker slot until the
+    countdown expires. Returns without raising once TASK_MAX_RETRIES is used
+    up; the task then fails (see task_failure_handler).
+    """
+    if task.request.retries >= config.Config.TASK_MAX_RETRIES:
+        return
+    countdown = retry_countdown(task.request.retries, error)
+    logger.warning(f"Transient error in task {task_id}, retrying in {countdown:.1f}s "
+                   f"(retry {task.request.retries + 1}/{config.Config.TASK_MAX_RETRIES}): {str(error)}")
+    task_state.retry(task_id, f"Temporary error, retrying in {countdown:.0f} seconds: {str(error)}")
+    raise task.retry(exc=error, countdown=countdown, max_retries=config.Config.TASK_MAX_RETRIES)
+
+def fetch_audio(task):
+    """
+    Download the task input and decode its audio.
+
+    With STREAMING_DECODE the HTTP body is piped straight into ffmpeg, so
+    decoding overlaps the download and the input never touches the disk.
+    Inputs that cannot be decoded from a pipe (MP4 with the index at the end)
+    fall back to a download to a temporary file.
+
+    Inputs the storage backend can read directly (local storage) are decoded
+    in place without any copy.
+
+    Returns (audio, DownloadStats).
+    """
+    storage = get_storage()
+    local_path = storage.local_path(task.input_gofile_link)
+    if local_path:
+        return decode_audio(local_path), DownloadStats().finish()
+
+    if config.Config.STREAMING_DECODE:
+        stats = DownloadStats()
+        try:
+            audio = decode_audio_stream(storage.iter_download(task.input_gofile_link, stats=stats))
+            return audio, stats.finish()
+        except TransientError:
+            # The download failed, not the decode: retry the task later
+            raise
+        except RuntimeError as e:
+            logger.warning(f"Streaming decode failed, falling back to a full download: {str(e)}")
+
+    # Create a temporary file
+    temp_fd, temp_path = tempfile.mkstemp(suffix=os.path.splitext(task.original_filename)[1])
+    os.close(temp_fd)
+    
+    try:
+        stats = storage.download(task.input_gofile_link, temp_path)
+        return decode_audio(temp_path), stats
+    finally:
+        # Clean up temporary file
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
 
 @celery_app.task(bind=True, name='generate_subtitles')
 def generate_subtitles(self, task_id):
     """Celery task to generate subtitles from an audio/video file."""
     try:
-        app, db = get_app_context()
-        with app.app_context():
+        with session_scope() as session:
             # Get task from database
-            task = SubtitleTask.query.filter_by(task_id=task_id).first()
+            task = session.query(SubtitleTask).filter_by(task_id=task_id).first()
             
             if not task:
                 raise ValueError(f"Task with ID {task_id} not found")
             
+            # A retry after the transcription finished only redoes the upload
+            transcription = stored_transcription(task)
+            if transcription is not None:
+                logger.info(f"Task {task_id} already transcribed, resuming at upload")
+                self.update_state(state='UPLOADING', meta={'progress': 'Uploading subtitle file...'})
+                return complete_with_subtitles(task, transcription, session)
+            
             # Download file from Gofile
             self.update_state(state='PROCESSING', meta={'progress': 'Downloading file...'})
-            task.celery_status = 'PROCESSING'
-            task.progress = 'Downloading file...'
-            db.session.commit()
+            task_state.progress(task_id, 'PROCESSING', 'Downloading file...')
             
-            # Create a temporary file
-            temp_fd, temp_path = tempfile.mkstemp(suffix=os.path.splitext(task.original_filename)[1])
-            os.close(temp_fd)
+            audio, download_stats = fetch_audio(task)
+            task.download_bytes = download_stats.bytes
+            task.download_seconds = download_stats.seconds
             
-            try:
-                # Download the file
-                response = requests.get(task.input_gofile_link, stream=True)
-                response.raise_for_status()
-                
-                with open(temp_path, 'wb') as f:
-                    for chunk in response.iter_content(chunk_size=8192): 
-                        if chunk:
-                            f.write(chunk)
-                
-                # Process the file with Whisper
-                self.update_state(state='PROCESSING', meta={'progress': 'Generating subtitles...'})
-                task.celery_status = 'PROCESSING'
-                task.progress = 'Generating subtitles...'
-                db.session.commit()
-                
-                subtitle_path = process_file(
-                    temp_path, 
-                    language=task.language, 
-                    model=task.model, 
-                    format_type=task.format_type,
-                    output_language=task.output_language
-                )
-                
-                # Upload subtitles to Gofile
+            # Process the file with Whisper
+            self.update_state(state='PROCESSING', meta={'progress': 'Generating subtitles...'})
+            task_state.progress(task_id, 'PROCESSING', 'Generating subtitles...', force=True)
+            
+            # Skip Whisper entirely if this audio was already transcribed with the same parameters
+            cache = get_cache()
+            cache_key = transcription_cache_key(task, audio) if cache else None
+            transcription = cache.get(cache_key, audio_bytes=audio.nbytes) if cache else None
+            if transcription is not None:
+                logger.info(f"Transcription cache hit for task {task_id}")
                 self.update_state(state='UPLOADING', meta={'progress': 'Uploading subtitle file...'})
-                task.celery_status = 'UPLOADING'
-                task.progress = 'Uploading subtitle file...'
-                db.session.commit()
-                
-                subtitle_filename = f"{os.path.splitext(task.original_filename)[0]}.{task.format_type}"
-                
-                upload_result = upload_to_gofile(subtitle_path, subtitle_filename)
-                
-                # Update task with result information
-                task.subtitle_gofile_id = upload_result['fileId']
-                task.subtitle_gofile_link = upload_result['downloadPage']
-                task.subtitle_filename = subtitle_filename
-                task.status = 'completed'
-                task.completed_at = datetime.datetime.utcnow()
-                task.progress = 'Subtitles generated successfully'
-                
-                db.session.commit()
-                
-                # Clean up temporary subtitle file
-                if os.path.exists(subtitle_path):
-                    os.remove(subtitle_path)
-                
+                return complete_with_subtitles(task, transcription, session)
+            
+            if should_distribute(audio):
+                task.audio_duration = len(audio) / SAMPLE_RATE
+                task.skipped_audio_seconds = 0.0
+                regions = None
+                if config.Config.WHISPER_VAD_ENABLED:
+                    audio, regions, task.skipped_audio_seconds = apply_vad(audio)
+                    if len(regions) == 0:
+                        transcription = {'segments': [], 'audio_seconds': task.audio_duration,
+                                         'skipped_seconds': task.skipped_audio_seconds}
+                        return complete_with_subtitles(task, transcription, session)
+                # Commit before dispatching so the chord callback sees the audio statistics
+                session.commit()
+                task_state.progress(task_id, 'PROCESSING', 'Transcribing chunks...', force=True)
+                chunk_count = dispatch_chunks(task, audio, regions, cache_key)
                 return {
-                    'status': 'success',
+                    'status': 'dispatched',
                     'task_id': task_id,
-                    'subtitle_gofile_link': task.subtitle_gofile_link
+                    'chunks': chunk_count
                 }
-                
-            finally:
-                # Clean up temporary file
-                if os.path.exists(temp_path):
-                    os.remove(temp_path)
-                    
+            
+            transcription = transcribe_samples(
+                audio,
+                language=task.language,
+                model_name=task.model,
+                output_language=task.output_language
+            )
+            if cache:
+                cache.put(cache_key, transcription)
+            
+            # Upload subtitles to Gofile
+            self.update_state(state='UPLOADING', meta={'progress': 'Uploading subtitle file...'})
+            return complete_with_subtitles(task, transcription, session)
+            
+    except TransientError as e:
+        retry_later(self, task_id, e)
+        logger.error(f"Error generating subtitles, giving up after {self.request.retries} retries: {str(e)}")
+        raise
     except Exception as e:
         logger.error(f"Error generating subtitles: {str(e)}")
-        app, db = get_app_context()
-        with app.app_context():
-            task = SubtitleTask.query.filter_by(task_id=task_id).first()
-            if task:
-                task.status = 'failed'
-                task.message = str(e)
-                task.progress = f"Error: {str(e)}"
-                db.session.commit()
-        
         raise
+
+@celery_app.task(name='transcribe_chunk')
+def transcribe_chunk(chunk_path, model_name, transcription_options):
+    """Celery task to transcribe one chunk of a distributed transcription."""
+    audio = load_chunk(chunk_path)
+    result = get_model(model_name).transcribe(audio, **transcription_options)
+    return [
+        {'start': segment['start'], 'end': segment['end'], 'text': segment['text']}
+        for segment in result['segments']
+    ]
+
+@celery_app.task(bind=True, name='stitch_subtitles')
+def stitch_subtitles(self, chunk_segments, task_id, spans, language, cache_key=None, upload=True, started=None):
+    """
+    Chord callback: merge the chunk segments and complete the subtitle task.
+
+    Without `upload` (in the staged pipeline) the segments are only stored,
+    and the chain continues with upload_stage.
+    """
+    try:
+        with session_scope() as session:
+            task = session.query(SubtitleTask).filter_by(task_id=task_id).first()
+            if not task:
+                raise ValueError(f"Task with ID {task_id} not found")
+
+            # Retried after a failed upload: the stitched segments are already stored
+            transcription = stored_transcription(task)
+            if transcription is None:
+                segments = stitch_segments([
+                    (offset, duration, segments)
+                    for (offset, duration), segments in zip(spans, chunk_segments)
+                ])
+                regions_path = os.path.join(config.Config.CHUNK_STORAGE_DIR, task_id, 'regions.npy')
+                if os.path.exists(regions_path):
+                    segments = remap_segments(segments, np.load(regions_path))
+                transcription = {
+                    'text': ''.join(segment['text'] for segment in segments),
+                    'segments': segments,
+                    'language': language,
+                    # Audio statistics were recorded when the chunks were dispatched
+                    'audio_seconds': task.audio_duration,
+                    'skipped_seconds': task.skipped_audio_seconds,
+                }
+                cache = get_cache()
+                if cache and cache_key:
+                    cache.put(cache_key, transcription)
+
+            if not upload:
+                store_transcription(task, transcription)
+                if started is not None:
+                    task.record_stage('transcribe', time.time() - started)
+                session.commit()
+                return {'task_id': task_id, 'handoff': time.time()}
+
+            self.update_state(state='UPLOADING', meta={'progress': 'Uploading subtitle file...'})
+            return complete_with_subtitles(task, transcription, session)
+
+    except TransientError as e:
+        retry_later(self, task_id, e)
+        logger.error(f"Error stitching subtitles, giving up after {self.request.retries} retries: {str(e)}")
+        raise
+    except Exception as e:
+        logger.error(f"Error stitching subtitles: {str(e)}")
+        raise
+    finally:
+        shutil.rmtree(os.path.join(config.Config.CHUNK_STORAGE_DIR, task_id), ignore_errors=True)
+
+@celery_app.task(name='chunks_failed')
+def chunks_failed(request, exc, traceback, task_id):
+    """Chord error callback: mark the subtitle task failed and drop its chunks."""
+    logger.error(f"Chunk transcription failed for task {task_id}: {exc}")
+    task_state.fail(task_id, exc)
+    shutil.rmtree(os.path.join(config.Config.CHUNK_STORAGE_DIR, task_id), ignore_errors=True)
+
+# Staged pipeline (see start_pipeline). Stages hand each other an artifact
+# reference, {'task_id', 'handoff', ...}: the downloaded input travels as a
+# path in CHUNK_STORAGE_DIR, and the transcription as the segments stored on
+# the SubtitleTask. 'handoff' is when the previous stage finished, so each
+# stage can record how long it waited in its queue.
+
+@contextlib.contextmanager
+def pipeline_stage(celery_task, stage, task_id, artifact=None):
+    """
+    Run one stage of the staged pipeline; yields (task, session).
+
+    Records the stage and its timings on the SubtitleTask. Failures are
+    handled as in generate_subtitles: transient errors schedule a retry of
+    the stage, anything else fails the task (see task_failure_handler).
+    """
+    started = time.time()
+    try:
+        with session_scope() as session:
+            task = session.query(SubtitleTask).filter_by(task_id=task_id).first()
+            if not task:
+                raise ValueError(f"Task with ID {task_id} not found")
+
+            if artifact is not None:
+                wait = started - artifact['handoff']
+            else:
+                wait = (datetime.datetime.utcnow() - task.created_at).total_seconds() if task.created_at else None
+            task.stage = stage
+            task.record_stage(stage, 0.0, wait)
+            session.commit()
+
+            yield task, session
+
+            task.record_stage(stage, time.time() - started)
+            session.commit()
+            logger.info(f"Stage {stage} of task {task_id} took {time.time() - started:.2f}s"
+                        + (f" after waiting {wait:.2f}s" if wait is not None else ""))
+    except TaskPredicate:
+        # Retry, or the stage was replaced by a chord
+        raise
+    except TransientError as e:
+        retry_later(celery_task, task_id, e)
+        logger.error(f"Error in stage {stage}, giving up after {celery_task.request.retries} retries: {str(e)}")
+        raise
+    except Exception as e:
+        logger.error(f"Error in stage {stage} of task {task_id}: {str(e)}")
+        raise
+
+def handoff(artifact, **fields):
+    """Return the artifact reference for the next stage."""
+    return dict(artifact, handoff=time.time(), **fields)
+
+def fetch_input(task):
+    """
+    Download the task input into CHUNK_STORAGE_DIR for the transcribe stage.
+
+    Inputs the storage backend can read directly (local storage) are not
+    copied. Returns (path, DownloadStats).
+    """
+    storage = get_storage()
+    local_path = storage.local_path(task.input_gofile_link)
+    if local_path:
+        return local_path, DownloadStats().finish()
+
+    input_dir = os.path.join(config.Config.CHUNK_STORAGE_DIR, task.task_id)
+    os.makedirs(input_dir, exist_ok=True)
+    input_path = os.path.join(input_dir, f"input{os.path.splitext(task.original_filename)[1]}")
+    return input_path, storage.download(task.input_gofile_link, input_path)
+
+@celery_app.task(bind=True, name='download_stage')
+def download_stage(self, task_id):
+    """Pipeline stage (I/O queue): download the input for the transcribe stage."""
+    artifact = {'task_id': task_id, 'input': None}
+    with pipeline_stage(self, 'download', task_id) as (task, session):
+        # Retried after the transcription finished: nothing to download
+        if task.segment_count is not None:
+            return handoff(artifact)
+
+        task_state.progress(task_id, 'PROCESSING', 'Downloading file...')
+
+        input_path, download_stats = fetch_input(task)
+        task.download_bytes = download_stats.bytes
+        task.download_seconds = download_stats.seconds
+        session.commit()
+        task_state.progress(task_id, 'PROCESSING', 'Waiting for a transcription worker...', force=True)
+        return handoff(artifact, input=input_path)
+
+@celery_app.task(bind=True, name='transcribe_stage')
+def transcribe_stage(self, artifact):
+    """
+    Pipeline stage (model queue): decode and transcribe the input and store the segments.
+
+    Decoding runs here rather than in download_stage, so the CPU-heavy
+    ffmpeg work stays off the I/O workers. The transcription cache is
+    checked once the audio is decoded.
+    """
+    task_id = artifact['task_id']
+    started = time.time()
+    with pipeline_stage(self, 'transcribe', task_id, artifact) as (task, session):
+        # A retry after the transcription finished
+        if task.segment_count is not None:
+            return handoff(artifact, input=None)
+
+        task_state.progress(task_id, 'PROCESSING', 'Generating subtitles...', force=True)
+
+        audio = decode_audio(artifact['input'])
+        if artifact['input'].startswith(os.path.join(config.Config.CHUNK_STORAGE_DIR, task_id) + os.sep):
+            os.remove(artifact['input'])
+
+        cache = get_cache()
+        cache_key = transcription_cache_key(task, audio) if cache else None
+        transcription = cache.get(cache_key, audio_bytes=audio.nbytes) if cache else None
+        if transcription is not None:
+            logger.info(f"Transcription cache hit for task {task_id}")
+            store_transcription(task, transcription)
+            return handoff(artifact, input=None)
+
+        if should_distribute(audio):
+            task.audio_duration = len(audio) / SAMPLE_RATE
+            task.skipped_audio_seconds = 0.0
+            regions = None
+            if config.Config.WHISPER_VAD_ENABLED:
+                audio, regions, task.skipped_audio_seconds = apply_vad(audio)
+                if len(regions) == 0:
+                    store_transcription(task, {'segments': [], 'audio_seconds': task.audio_duration,
+                                               'skipped_seconds': task.skipped_audio_seconds})
+                    return handoff(artifact, input=None)
+            session.commit()
+            task_state.progress(task_id, 'PROCESSING', 'Transcribing chunks...', force=True)
+            # The chord takes this stage's place; its stitch callback hands off to upload_stage
+            signature, _ = build_chunk_chord(task, audio, regions, cache_key,
+                                             upload=False, started=started)
+            return self.replace(signature)
+
+        transcription = transcribe_samples(
+            audio,
+            language=task.language,
+            model_name=task.model,
+            output_language=task.output_language
+        )
+        if cache:
+            cache.put(cache_key, transcription)
+        store_transcription(task, transcription)
+        return handoff(artifact, input=None)
+
+@celery_app.task(bind=True, name='upload_stage')
+def upload_stage(self, artifact):
+    """Pipeline stage (I/O queue): render and upload the stored segments."""
+    with pipeline_stage(self, 'upload', artifact['task_id'], artifact) as (task, session):
+        results = upload_subtitles(task, stored_transcription(task))
+        return handoff(artifact, results=results)
+
+@celery_app.task(bind=True, name='notify_stage')
+def notify_stage(self, artifact):
+    """Pipeline stage (I/O queue): mark the task completed and clean up its artifacts."""
+    task_id = artifact['task_id']
+    with pipeline_stage(self, 'notify', task_id, artifact) as (task, session):
+        task_state.complete(task_id, **artifact['results'])
+    shutil.rmtree(os.path.join(config.Config.CHUNK_STORAGE_DIR, task_id), ignore_errors=True)
+    return {
+        'status': 'success',
+        'task_id': task_id,
+        'subtitle_gofile_link': artifact['results']['subtitle_gofile_link']
+    }
+
+@celery_app.task(name='add_to_gofile_account', ignore_result=True)
+def add_to_gofile_account(file_id):
+    """Follow-up to an upload: add the file to the Gofile account."""
+    add_to_account(file_id)
+
+def dispatch_add_to_account(file_id):
+    """Send add_to_gofile_account to a queue some worker consumes."""
+    add_to_gofile_account.apply_async(args=[file_id], queue=io_queue())
+
+# Adding uploads to the account runs as its own task, off the upload path
+set_account_dispatcher(dispatch_add_to_account)
@@ -1,4 +1,5 @@
 import os
+import tempfile
 
 class Config:
     """Base configuration."""
@@ -8,17 +9,162 @@ class Config:
     # SQLAlchemy config
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'sqlite:///subtitles.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Celery workers use their own engine (see database.py) instead of the
+    # Flask app. Each process keeps WORKER_DB_POOL_SIZE connections (0 sizes
+    # the pool to the worker: two per task slot, for the task's session and
+    # its state transitions); connections are checked before use and recycled
+    # after WORKER_DB_POOL_RECYCLE seconds. SQLite databases run in WAL mode.
+    WORKER_DB_POOL_SIZE = int(os.environ.get('WORKER_DB_POOL_SIZE', '0'))
+    WORKER_DB_MAX_OVERFLOW = int(os.environ.get('WORKER_DB_MAX_OVERFLOW', '2'))
+    WORKER_DB_POOL_TIMEOUT = int(os.environ.get('WORKER_DB_POOL_TIMEOUT', '30'))
+    WORKER_DB_POOL_RECYCLE = int(os.environ.get('WORKER_DB_POOL_RECYCLE', '1800'))
+    # Seconds a SQLite writer waits for the database lock
+    WORKER_DB_BUSY_TIMEOUT = float(os.environ.get('WORKER_DB_BUSY_TIMEOUT', '30'))
     
     # Celery config
     CELERY_BROKER_URL = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
     CELERY_RESULT_BACKEND = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
+    # Tasks go to a per-model queue when a worker consumes it, otherwise to the
+    # shared queue. Workers advertise their queues in Redis every
+    # CELERY_QUEUE_DISCOVERY_TTL seconds, and senders cache them as long.
+    CELERY_SHARED_QUEUE = os.environ.get('CELERY_SHARED_QUEUE', 'celery')
+    CELERY_MODEL_QUEUE_PREFIX = os.environ.get('CELERY_MODEL_QUEUE_PREFIX', 'whisper.')
+    CELERY_QUEUE_DISCOVERY_TTL = int(os.environ.get('CELERY_QUEUE_DISCOVERY_TTL', '30'))
+    # Page size of /api/my-tasks (default, and the most a client may ask for)
+    MY_TASKS_PAGE_SIZE = int(os.environ.get('MY_TASKS_PAGE_SIZE', '20'))
+    MY_TASKS_MAX_PAGE_SIZE = int(os.environ.get('MY_TASKS_MAX_PAGE_SIZE', '100'))
+    
+    # Progress messages of a running task are written at most this often
+    # (seconds) unless its celery_status changes
+    TASK_PROGRESS_MIN_INTERVAL = float(os.environ.get('TASK_PROGRESS_MIN_INTERVAL', '2'))
+    
+    # Most task IDs accepted by one /api/tasks/status request
+    STATUS_BATCH_MAX_IDS = int(os.environ.get('STATUS_BATCH_MAX_IDS', '500'))
+    
+    # The `since` cursor returned by /api/tasks/status trails the query time by
+    # this many seconds. updated_at is set before the writing transaction
+    # commits, so a row can become visible with an updated_at older than an
+    # earlier query; keep this above the longest task write transaction.
+    STATUS_SINCE_OVERLAP_SECONDS = float(os.environ.get('STATUS_SINCE_OVERLAP_SECONDS', '30'))
+    
+    # Task progress events: the worker publishes every task update to Redis
+    # pub/sub, streamed to browsers by /api/task/<id>/events. Each open stream
+    # holds a web worker thread, so the app is served with gthread workers
+    # (see gunicorn.conf.py). Streams end after TASK_EVENTS_MAX_SECONDS, which
+    # must stay below the gunicorn worker timeout, and are resumed by the
+    # browser; TASK_EVENTS_HEARTBEAT is the keep-alive interval. At most
+    # TASK_EVENTS_MAX_STREAMS streams are open per web process, which must stay
+    # below GUNICORN_THREADS so regular requests keep threads to run on; past
+    # it, clients get a 503 and poll /api/task/<id> instead.
+    TASK_EVENTS_ENABLED = os.environ.get('TASK_EVENTS_ENABLED', 'true').lower() == 'true'
+    TASK_EVENTS_REDIS_URL = os.environ.get('TASK_EVENTS_REDIS_URL', os.environ.get('REDIS_URL', 'redis://localhost:6379/0'))
+    TASK_EVENTS_HEARTBEAT = int(os.environ.get('TASK_EVENTS_HEARTBEAT', '10'))
+    TASK_EVENTS_MAX_SECONDS = int(os.environ.get('TASK_EVENTS_MAX_SECONDS', '25'))
+    TASK_EVENTS_MAX_STREAMS = int(os.environ.get('TASK_EVENTS_MAX_STREAMS', '16'))
+    TASK_EVENTS_SNAPSHOT_TTL = int(os.environ.get('TASK_EVENTS_SNAPSHOT_TTL', str(24 * 3600)))
+    
+    # Run each task as a chain of stages: download, upload and notification
+    # on CELERY_IO_QUEUE (for a cheap, high-concurrency worker, e.g.
+    # `celery -A celery_worker worker -Q io -P threads -c 64`), decoding and
+    # transcription on the model queues. The input is handed over as a file
+    # in CHUNK_STORAGE_DIR, so the pipeline only runs once CHUNK_STORAGE_DIR
+    # is set explicitly to a directory every worker shares.
+    CELERY_STAGED_PIPELINE = os.environ.get('CELERY_STAGED_PIPELINE', 'false').lower() == 'true'
+    CELERY_IO_QUEUE = os.environ.get('CELERY_IO_QUEUE', 'io')
     
     # Whisper config
     WHISPER_MODELS = ['tiny', 'base', 'small', 'medium', 'large']
     DEFAULT_WHISPER_MODEL = 'base'
+    # Budget for the weights of the models loaded in each worker process (0 disables eviction)
+    WHISPER_MODEL_MEMORY_BUDGET_MB = int(os.environ.get('WHISPER_MODEL_MEMORY_BUDGET_MB', '0'))
+    # Models loaded in the Celery parent before forking, shared copy-on-write
+    # by the pool children (comma-separated names from WHISPER_MODELS, or 'all')
+    WHISPER_PRELOAD_MODELS = [
+        name.strip() for name in os.environ.get('WHISPER_PRELOAD_MODELS', '').split(',') if name.strip()
+    ]
+    # Pipe the input download straight into ffmpeg instead of saving it to disk first
+    STREAMING_DECODE = os.environ.get('STREAMING_DECODE', 'false').lower() == 'true'
+    # Media longer than this is split at silences into chunks transcribed in
+    # parallel by a local process pool (0 disables). Every pool process loads
+    # its own model, so the pool is sized to fit WHISPER_CHUNK_MEMORY_BUDGET_MB
+    # (WHISPER_CHUNK_WORKERS overrides) and stops after
+    # WHISPER_CHUNK_POOL_IDLE_SECONDS unused. Celery prefork children cannot
+    # start it: run such workers with -P solo or -P threads.
+    WHISPER_LONG_MEDIA_SECONDS = int(os.environ.get('WHISPER_LONG_MEDIA_SECONDS', '0'))
+    WHISPER_CHUNK_MIN_SECONDS = int(os.environ.get('WHISPER_CHUNK_MIN_SECONDS', '30'))
+    WHISPER_CHUNK_MAX_SECONDS = int(os.environ.get('WHISPER_CHUNK_MAX_SECONDS', '120'))
+    WHISPER_CHUNK_WORKERS = int(os.environ.get('WHISPER_CHUNK_WORKERS', '0'))
+    WHISPER_CHUNK_MEMORY_BUDGET_MB = int(os.environ.get('WHISPER_CHUNK_MEMORY_BUDGET_MB', '4096'))
+    WHISPER_CHUNK_POOL_IDLE_SECONDS = int(os.environ.get('WHISPER_CHUNK_POOL_IDLE_SECONDS', '300'))
+    # Energy/zero-crossing voice activity detection drops non-speech audio before inference
+    WHISPER_VAD_ENABLED = os.environ.get('WHISPER_VAD_ENABLED', 'false').lower() == 'true'
+    WHISPER_VAD_THRESHOLD_DB = float(os.environ.get('WHISPER_VAD_THRESHOLD_DB', '12'))
+    WHISPER_VAD_MIN_DB = float(os.environ.get('WHISPER_VAD_MIN_DB', '-55'))
+    WHISPER_VAD_MAX_ZCR = float(os.environ.get('WHISPER_VAD_MAX_ZCR', '0.35'))
+    # Media longer than this is fanned out as chunk tasks across the Celery
+    # cluster (0 disables). Chunks are stored in CHUNK_STORAGE_DIR, which must
+    # be shared by every worker.
+    WHISPER_DISTRIBUTED_SECONDS = int(os.environ.get('WHISPER_DISTRIBUTED_SECONDS', '0'))
+    CHUNK_STORAGE_DIR = os.environ.get('CHUNK_STORAGE_DIR', os.path.join(tempfile.gettempdir(), 'whisper-chunks'))
+    CHUNK_STORAGE_DIR_CONFIGURED = bool(os.environ.get('CHUNK_STORAGE_DIR'))
+    # Models whose queues this worker consumes (empty means the shared queue only).
+    # These models are also preloaded when WHISPER_PRELOAD_MODELS is not set.
+    WHISPER_WORKER_MODELS = [
+        name.strip() for name in os.environ.get('WHISPER_WORKER_MODELS', '').split(',') if name.strip()
+    ]
+    # Whether a worker with WHISPER_WORKER_MODELS also consumes the shared queue
+    WHISPER_WORKER_CONSUME_SHARED = os.environ.get('WHISPER_WORKER_CONSUME_SHARED', 'false').lower() == 'true'
+    
+    # Subtitle formats that can be rendered from stored segments
+    SUBTITLE_FORMATS = ('srt', 'vtt', 'txt', 'json')
+    
+    # Transcription result cache, keyed by decoded audio hash and parameters
+    TRANSCRIPTION_CACHE_ENABLED = os.environ.get('TRANSCRIPTION_CACHE_ENABLED', 'true').lower() == 'true'
+    TRANSCRIPTION_CACHE_DIR = os.environ.get(
+        'TRANSCRIPTION_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'whisper-transcriptions')
+    )
+    TRANSCRIPTION_CACHE_MAX_MB = int(os.environ.get('TRANSCRIPTION_CACHE_MAX_MB', '1024'))
+    # Share cache entries between workers through Redis (empty disables)
+    TRANSCRIPTION_CACHE_REDIS_URL = os.environ.get('TRANSCRIPTION_CACHE_REDIS_URL', '')
+    TRANSCRIPTION_CACHE_REDIS_TTL = int(os.environ.get('TRANSCRIPTION_CACHE_REDIS_TTL', str(7 * 24 * 3600)))
+    # Hit and miss counters, shared by the workers and /api/cache/stats
+    TRANSCRIPTION_CACHE_STATS_REDIS_URL = os.environ.get(
+        'TRANSCRIPTION_CACHE_STATS_REDIS_URL', os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
+    )
+    
+    # Download engine: pooled session, large buffers, parallel ranges and resume
+    DOWNLOAD_POOL_SIZE = int(os.environ.get('DOWNLOAD_POOL_SIZE', '16'))
+    DOWNLOAD_CHUNK_SIZE = int(os.environ.get('DOWNLOAD_CHUNK_SIZE', str(1024 * 1024)))
+    DOWNLOAD_PARALLEL_PARTS = int(os.environ.get('DOWNLOAD_PARALLEL_PARTS', '4'))
+    DOWNLOAD_PARALLEL_MIN_MB = int(os.environ.get('DOWNLOAD_PARALLEL_MIN_MB', '32'))
+    DOWNLOAD_MAX_RETRIES = int(os.environ.get('DOWNLOAD_MAX_RETRIES', '5'))
+    DOWNLOAD_TIMEOUT = int(os.environ.get('DOWNLOAD_TIMEOUT', '60'))
+    
+    # Storage backend for task inputs and subtitle files: 'gofile' or 'local'
+    STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'gofile')
+    # Root of the local backend; must be a volume shared by the web app and the workers
+    LOCAL_STORAGE_ROOT = os.environ.get('LOCAL_STORAGE_ROOT', os.path.join(tempfile.gettempdir(), 'whisper-storage'))
+    # Prefix of local file links (empty for links relative to the web app)
+    LOCAL_STORAGE_BASE_URL = os.environ.get('LOCAL_STORAGE_BASE_URL', '')
+    
+    # Transient storage and network failures reschedule the task instead of
+    # sleeping in the worker: up to TASK_MAX_RETRIES times, with exponential
+    # backoff from TASK_RETRY_BACKOFF seconds (capped, with jitter)
+    TASK_MAX_RETRIES = int(os.environ.get('TASK_MAX_RETRIES', '5'))
+    TASK_RETRY_BACKOFF = int(os.environ.get('TASK_RETRY_BACKOFF', '10'))
+    TASK_RETRY_BACKOFF_MAX = int(os.environ.get('TASK_RETRY_BACKOFF_MAX', '600'))
     
     # Gofile config
     GOFILE_API_URL = 'https://api.gofile.io'
+    # Upload server lookups are cached in memory and in Redis, and refreshed
+    # in the background GOFILE_SERVER_REFRESH_AHEAD seconds before expiry
+    GOFILE_SERVER_TTL = int(os.environ.get('GOFILE_SERVER_TTL', '300'))
+    GOFILE_SERVER_REFRESH_AHEAD = int(os.environ.get('GOFILE_SERVER_REFRESH_AHEAD', '60'))
+    GOFILE_SERVER_CACHE_REDIS_URL = os.environ.get('GOFILE_SERVER_CACHE_REDIS_URL', os.environ.get('REDIS_URL', ''))
+    # Gofile client used for uploads: 'sync' (requests) or 'async' (aiohttp,
+    # streaming multipart over a persistent pool of GOFILE_POOL_SIZE connections)
+    GOFILE_CLIENT = os.environ.get('GOFILE_CLIENT', 'sync')
+    GOFILE_POOL_SIZE = int(os.environ.get('GOFILE_POOL_SIZE', '8'))
     
     # File upload config
     MAX_CONTENT_LENGTH = 512 * 1024 * 1024  # 512 MB
@@ -0,0 +1,159 @@
+import os
+import logging
+import threading
+import contextlib
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import scoped_session, sessionmaker
+from config import Config
+
+# Configure logging
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+# Flask-SQLAlchemy extension, bound to the web app by app.create_app()
+db = SQLAlchemy()
+
+# Same default as Flask: the 'instance' folder next to app.py
+INSTANCE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance')
+
+# Connections held by each worker process; set by configure_worker_pool()
+_pool_size = None
+_engine = None
+_engine_lock = threading.Lock()
+
+# Worker sessions, one per thread
+Session = scoped_session(sessionmaker(expire_on_commit=True))
+
+
+def database_url(uri=None):
+    """
+    Return the database URL the web app uses for `uri`.
+
+    Flask-SQLAlchemy resolves relative SQLite paths against the app's
+    instance folder; the worker must open the same file.
+    """
+    url = make_url(uri or Config.SQLALCHEMY_DATABASE_URI)
+    if url.get_backend_name() == 'sqlite' and url.database and url.database != ':memory:' \
+            and not url.database.startswith('file:') and not os.path.isabs(url.database):
+        os.makedirs(INSTANCE_PATH, exist_ok=True)
+        url = url.set(database=os.path.join(INSTANCE_PATH, url.database))
+    return url
+
+
+def configure_worker_pool(concurrency, pool='prefork'):
+    """
+    Size the worker connection pool for a worker of `concurrency` slots.
+
+    A running task holds one connection for its session and briefly a
+    second one for each state transition (see task_state). Prefork children
+    run one task at a time, so they need two connections; thread and
+    greenlet pools share the process between all their slots.
+    WORKER_DB_POOL_SIZE overrides the computed size.
+    """
+    global _pool_size
+    if Config.WORKER_DB_POOL_SIZE:
+        _pool_size = Config.WORKER_DB_POOL_SIZE
+    elif pool in ('threads', 'gevent', 'eventlet'):
+        _pool_size = 2 * max(1, concurrency)
+    else:
+        _pool_size = 2
+    logger.info(f"Worker database pool: {_pool_size} connections (+{Config.WORKER_DB_MAX_OVERFLOW} overflow)")
+
+
+def enable_sqlite_wal(dbapi_connection, connection_record):
+    """Put a new SQLite connection in WAL mode, so readers and the writer do not block each other."""
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    # WAL makes NORMAL as safe as FULL against corruption, with far fewer fsyncs
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.execute(f'PRAGMA busy_timeout={int(Config.WORKER_DB_BUSY_TIMEOUT * 1000)}')
+    cursor.close()
+
+
+def get_engine():
+    """Return the worker's SQLAlchemy engine, creating it on first use."""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            url = database_url()
+            options = {'pool_pre_ping': True, 'pool_recycle': Config.WORKER_DB_POOL_RECYCLE}
+            if url.get_backend_name() != 'sqlite' or url.database not in (None, '', ':memory:'):
+                options.update(pool_size=_pool_size or 1, max_overflow=Config.WORKER_DB_MAX_OVERFLOW,
+                               pool_timeout=Config.WORKER_DB_POOL_TIMEOUT)
+            _engine = create_engine(url, **options)
+            if url.get_backend_name() == 'sqlite':
+                event.listen(_engine, 'connect', enable_sqlite_wal)
+            Session.configure(bind=_engine)
+        return _engine
+
+
+def create_schema(engine, metadata):
+    """
+    Create missing tables, and bring existing ones up to date with the models.
+
+    create_all() never alters a table that already exists, so columns added
+    to a model since the table was created are added here with ALTER TABLE
+    ... ADD COLUMN (they must be nullable), and missing indexes are created.
+    Safe to run from several processes at once: a column or index another
+    process added in the meantime is skipped.
+    """
+    metadata.create_all(engine)
+    inspector = inspect(engine)
+    for table in metadata.sorted_tables:
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            column_type = column.type.compile(dialect=engine.dialect)
+            try:
+                with engine.begin() as connection:
+                    connection.execute(text(
+                        f'ALTER TABLE {engine.dialect.identifier_preparer.format_table(table)} '
+                        f'ADD COLUMN {engine.dialect.identifier_preparer.format_column(column)} {column_type}'
+                    ))
+                logger.info(f"Added column {table.name}.{column.name} ({column_type})")
+            except SQLAlchemyError as e:
+                logger.warning(f"Could not add column {table.name}.{column.name}: {str(e)}")
+        indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in indexes:
+                continue
+            try:
+                index.create(engine)
+                logger.info(f"Created index {index.name}")
+            except SQLAlchemyError as e:
+                logger.warning(f"Could not create index {index.name}: {str(e)}")
+
+
+def dispose_engine():
+    """
+    Drop the connections inherited from the parent after a fork.
+
+    The child opens its own connections; the parent's stay usable by the parent.
+    """
+    if _engine is not None:
+        _engine.dispose(close=False)
+
+
+@contextlib.contextmanager
+def session_scope():
+    """
+    Yield the worker session of the current thread.
+
+    Nested scopes share the session; the outermost one rolls back what was
+    not committed and returns the connection to the pool.
+    """
+    get_engine()
+    outermost = not Session.registry.has()
+    session = Session()
+    try:
+        yield session
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        if outermost:
+            Session.remove()
@@ -0,0 +1,269 @@
+import os
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from config import Config
+from errors import TransientNetworkError, is_transient
+
+# Configure logging
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """
+    Return the pooled HTTP session of this process.
+
+    The session is created lazily and again after a fork, so prefork
+    children never share sockets with their parent.
+    """
+    global _session, _session_pid
+    with _session_lock:
+        if _session is None or _session_pid != os.getpid():
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=Config.DOWNLOAD_POOL_SIZE,
+                pool_maxsize=Config.DOWNLOAD_POOL_SIZE
+            )
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _session = session
+            _session_pid = os.getpid()
+        return _session
+
+
+class DownloadStats:
+    """Byte count and timing of one download."""
+
+    def __init__(self):
+        self.bytes = 0
+        self.retries = 0
+        self.parts = 1
+        self.started = time.perf_counter()
+        self.seconds = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, count):
+        with self._lock:
+            self.bytes += count
+
+    def add_retry(self):
+        with self._lock:
+            self.retries += 1
+
+    def finish(self):
+        self.seconds = time.perf_counter() - self.started
+        return self
+
+    @property
+    def throughput(self):
+        """Average throughput in bytes per second."""
+        return self.bytes / self.seconds if self.seconds else 0.0
+
+    def to_dict(self):
+        return {
+            'bytes': self.bytes,
+            'seconds': round(self.seconds, 3),
+            'throughput': round(self.throughput, 1),
+            'parts': self.parts,
+            'retries': self.retries,
+        }
+
+
+def probe(url, headers=None):
+    """Return (size, accepts_ranges) for a URL; size is None when unknown."""
+    try:
+        response = get_session().head(url, headers=headers, allow_redirects=True,
+                                      timeout=Config.DOWNLOAD_TIMEOUT)
+        response.raise_for_status()
+    except requests.RequestException as e:
+        logger.debug(f"HEAD request failed, downloading without ranges: {str(e)}")
+        return None, False
+    size = response.headers.get('Content-Length')
+    accepts_ranges = response.headers.get('Accept-Ranges', '').lower() == 'bytes'
+    return (int(size) if size and size.isdigit() else None), accepts_ranges
+
+
+class RangeNotSatisfied(Exception):
+    """A range request was answered with something other than 206 Partial Content."""
+
+
+def _fetch_range(url, fd, start, end, stats, headers=None, abort=None):
+    """
+    Download bytes [start, end] into `fd` at the same offsets.
+
+    After a transient failure the request is repeated from the last byte
+    that was written, not from `start`. Raises RangeNotSatisfied when the
+    server does not answer with the range, and stops early once `abort`
+    (a threading.Event) is set.
+    """
+    offset = start
+    attempt = 0
+    while offset <= end:
+        if abort is not None and abort.is_set():
+            return
+        request_headers = dict(headers or {}, Range=f"bytes={offset}-{end}")
+        try:
+            with get_session().get(url, headers=request_headers, stream=True,
+                                   timeout=Config.DOWNLOAD_TIMEOUT) as response:
+                # A full 200 body, or 416 for a range the server cannot serve
+                if response.status_code != 206 and (response.ok or response.status_code == 416):
+                    raise RangeNotSatisfied(f"Server ignored range request for {url} (HTTP {response.status_code})")
+                response.raise_for_status()
+                for chunk in response.iter_content(chunk_size=Config.DOWNLOAD_CHUNK_SIZE):
+                    if abort is not None and abort.is_set():
+                        return
+                    if not chunk:
+                        continue
+                    chunk = chunk[:end + 1 - offset]
+                    os.pwrite(fd, chunk, offset)
+                    offset += len(chunk)
+                    stats.add(len(chunk))
+            if offset <= end:
+                raise requests.ConnectionError(f"Connection closed at byte {offset} of range ending at {end}")
+        except requests.RequestException as e:
+            if not is_transient(e):
+                raise
+            attempt += 1
+            stats.add_retry()
+            if attempt > Config.DOWNLOAD_MAX_RETRIES:
+                raise TransientNetworkError(f"Failed to download bytes {offset}-{end} after {attempt} attempts: {str(e)}")
+            logger.warning(f"Error downloading bytes {offset}-{end} (attempt {attempt}), resuming: {str(e)}")
+
+
+def _fetch_stream(url, path, stats, headers=None):
+    """
+    Download a URL sequentially into `path`.
+
+    When the server supports ranges, a transient failure resumes from the
+    bytes already on disk; otherwise the file is restarted.
+    """
+    offset = 0
+    attempt = 0
+    with open(path, 'wb') as f:
+        while True:
+            request_headers = dict(headers or {})
+            if offset:
+                request_headers['Range'] = f"bytes={offset}-"
+            try:
+                with get_session().get(url, headers=request_headers, stream=True,
+                                       timeout=Config.DOWNLOAD_TIMEOUT) as response:
+                    response.raise_for_status()
+                    if offset and response.status_code != 206:
+                        # No resume support: start over
+                        f.seek(0)
+                        f.truncate()
+                        offset = 0
+                    for chunk in response.iter_content(chunk_size=Config.DOWNLOAD_CHUNK_SIZE):
+                        if chunk:
+                            f.write(chunk)
+                            offset += len(chunk)
+                            stats.add(len(chunk))
+                return
+            except requests.RequestException as e:
+                if not is_transient(e):
+                    raise
+                attempt += 1
+                stats.add_retry()
+                if attempt > Config.DOWNLOAD_MAX_RETRIES:
+                    raise TransientNetworkError(f"Failed to download {url} after {attempt} attempts: {str(e)}")
+                logger.warning(f"Error downloading {url} at byte {offset} (attempt {attempt}), resuming: {str(e)}")
+                f.flush()
+
+
+def download(url, path, headers=None):
+    """
+    Download a URL to `path` and return its DownloadStats.
+
+    Files of at least DOWNLOAD_PARALLEL_MIN_MB on servers that accept range
+    requests are split into DOWNLOAD_PARALLEL_PARTS concurrent ranges, each
+    written in place and resumed from its last written byte after a
+    transient failure. Other files, and files whose server answers a range
+    request with anything but 206 despite advertising ranges, are streamed
+    sequentially.
+    """
+    stats = DownloadStats()
+    size, accepts_ranges = probe(url, headers)
+    parts = Config.DOWNLOAD_PARALLEL_PARTS
+
+    if size and accepts_ranges and parts > 1 and size >= Config.DOWNLOAD_PARALLEL_MIN_MB * 1024 * 1024:
+        part_size = -(-size // parts)
+        ranges = [(start, min(start + part_size, size) - 1) for start in range(0, size, part_size)]
+        stats.parts = len(ranges)
+
+        abort = threading.Event()
+        ranges_ignored = False
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        try:
+            os.ftruncate(fd, size)
+            with ThreadPoolExecutor(max_workers=len(ranges)) as executor:
+                futures = [
+                    executor.submit(_fetch_range, url, fd, start, end, stats, headers, abort)
+                    for start, end in ranges
+                ]
+                try:
+                    for future in futures:
+                        future.result()
+                finally:
+                    # Stop the other parts as soon as one fails
+                    abort.set()
+        except RangeNotSatisfied as e:
+            logger.warning(f"{str(e)}, downloading sequentially")
+            ranges_ignored = True
+        finally:
+            os.close(fd)
+        if ranges_ignored:
+            stats = DownloadStats()
+            _fetch_stream(url, path, stats, headers)
+    else:
+        _fetch_stream(url, path, stats, headers)
+
+    stats.finish()
+    logger.info(f"Downloaded {stats.bytes / (1024 * 1024):.1f} MB in {stats.seconds:.2f}s "
+                f"({stats.throughput / (1024 * 1024):.1f} MB/s, {stats.parts} parts, {stats.retries} retries)")
+    return stats
+
+
+def iter_download(url, headers=None, stats=None):
+    """
+    Yield the body of a URL in DOWNLOAD_CHUNK_SIZE chunks.
+
+    Used for streaming decode. A transient failure resumes with a range
+    request from the last byte yielded; if the server cannot resume, the
+    error is raised since the bytes already yielded cannot be taken back.
+    """
+    stats = stats or DownloadStats()
+    offset = 0
+    attempt = 0
+    while True:
+        request_headers = dict(headers or {})
+        if offset:
+            request_headers['Range'] = f"bytes={offset}-"
+        try:
+            with get_session().get(url, headers=request_headers, stream=True,
+                                   timeout=Config.DOWNLOAD_TIMEOUT) as response:
+                response.raise_for_status()
+                if offset and response.status_code != 206:
+                    raise RuntimeError(f"Cannot resume download of {url}: server ignored range request")
+                for chunk in response.iter_content(chunk_size=Config.DOWNLOAD_CHUNK_SIZE):
+                    if chunk:
+                        offset += len(chunk)
+                        stats.add(len(chunk))
+                        yield chunk
+            stats.finish()
+            return
+        except requests.RequestException as e:
+            if not is_transient(e):
+                raise
+            attempt += 1
+            stats.add_retry()
+            if attempt > Config.DOWNLOAD_MAX_RETRIES:
+                raise TransientNetworkError(f"Failed to download {url} after {attempt} attempts: {str(e)}")
+            logger.warning(f"Error streaming {url} at byte {offset} (attempt {attempt}), resuming: {str(e)}")
@@ -0,0 +1,49 @@
+import requests
+
+# HTTP statuses worth retrying later: rate limiting and server-side failures
+TRANSIENT_HTTP_STATUSES = {408, 425, 429, 500, 502, 503, 504}
+
+
+class TransientError(Exception):
+    """
+    A failure expected to go away if the operation is tried again later.
+
+    Raised instead of sleeping and retrying in place, so that the Celery task
+    can schedule its own retry and free the worker slot in the meantime.
+    `retry_after` is the delay the remote side asked for, in seconds, if any.
+    """
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TransientNetworkError(TransientError):
+    """Connection failure, timeout, or a retryable HTTP status."""
+
+
+class TransientStorageError(TransientError):
+    """The storage service answered, but cannot serve the request right now."""
+
+
+def is_transient(error):
+    """Return True if a requests exception is worth retrying later."""
+    if isinstance(error, (requests.ConnectionError, requests.Timeout)):
+        return True
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        return error.response.status_code in TRANSIENT_HTTP_STATUSES
+    return isinstance(error, requests.exceptions.ChunkedEncodingError)
+
+
+def retry_after(error):
+    """Return the Retry-After delay of a requests exception in seconds, or None."""
+    response = getattr(error, 'response', None)
+    value = response.headers.get('Retry-After') if response is not None else None
+    return int(value) if value and value.isdigit() else None
+
+
+def wrap_request_error(error, message):
+    """Return a TransientNetworkError for transient requests exceptions, else `error` itself."""
+    if is_transient(error):
+        return TransientNetworkError(f"{message}: {str(error)}", retry_after=retry_after(error))
+    return error
@@ -1,8 +1,15 @@
+import io
 import os
 import logging
+import contextlib
 import requests
 import json
 import time
+import uuid
+import threading
+from config import Config
+from downloader import download
+from errors import TransientStorageError, wrap_request_error
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
@@ -12,43 +19,191 @@ logger = logging.getLogger(__name__)
 GOFILE_API_URL = 'https://api.gofile.io'
 GOFILE_API_TOKEN = os.environ.get('GOFILE_API_TOKEN')
 
-def get_gofile_server():
-    """Get the best Gofile server for uploads."""
-    max_retries = 3
-    retry_count = 0
+def fetch_gofile_server():
+    """
+    Ask the Gofile API for the best server for uploads.
     
+    Makes a single attempt; transient failures raise TransientError so the
+    caller can retry later instead of sleeping here.
+    """
     # Add token to headers if available
     headers = {}
     if GOFILE_API_TOKEN:
         headers['Authorization'] = f'Bearer {GOFILE_API_TOKEN}'
         logger.info("Using Gofile API token for authentication")
     
-    while retry_count < max_retries:
+    try:
+        response = requests.get(f"{GOFILE_API_URL}/getServer", headers=headers, timeout=Config.DOWNLOAD_TIMEOUT)
+        response.raise_for_status()
+        data = response.json()
+    except requests.RequestException as e:
+        logger.warning(f"Error getting Gofile server: {str(e)}")
+        raise wrap_request_error(e, "Failed to get Gofile server") from e
+    
+    if data['status'] == 'ok':
+        return data['data']['server']
+    
+    # No server available right now
+    error_msg = f"Gofile API error: {data.get('message', 'Unknown error')}"
+    logger.error(error_msg)
+    raise TransientStorageError(error_msg)
+
+class ServerCache:
+    """
+    TTL cache for the Gofile upload server, shared through Redis.
+    
+    The server is cached in process memory and, when a Redis URL is given, in
+    Redis so the web app and the workers reuse each other's lookups.
+    Concurrent callers share one in-flight refresh: within a process through
+    a lock, across processes through a short Redis lock while the others wait
+    for its result. Once an entry is within `refresh_ahead` seconds of
+    expiring, it is refreshed in a background thread while callers keep
+    getting the cached value.
+    """
+    
+    REDIS_KEY = 'gofile:server'
+    REDIS_LOCK_KEY = 'gofile:server:lock'
+    # Delete the lock only if it still holds our token
+    RELEASE_LOCK_SCRIPT = """
+        if redis.call('get', KEYS[1]) == ARGV[1] then
+            return redis.call('del', KEYS[1])
+        end
+        return 0
+    """
+    
+    def __init__(self, fetch, ttl, refresh_ahead=0, redis_url=None):
+        self._fetch = fetch
+        self.ttl = ttl
+        self.refresh_ahead = refresh_ahead
+        self._redis_url = redis_url
+        self._redis = None
+        self._value = None
+        self._expires = 0.0
+        self._refresh_lock = threading.Lock()
+        self.upstream_calls = 0
+    
+    def get(self):
+        """Return the cached server, fetching it if there is no fresh entry."""
+        value, remaining = self._cached()
+        if value is not None:
+            if remaining < self.refresh_ahead and self._refresh_lock.acquire(blocking=False):
+                threading.Thread(target=self._background_refresh, daemon=True).start()
+            return value
+        
+        with self._refresh_lock:
+            # Another caller may have refreshed the entry while we waited
+            value, _ = self._cached()
+            if value is not None:
+                return value
+            return self._refresh()
+    
+    def invalidate(self):
+        """Drop the cached server, e.g. after an upload to it failed."""
+        self._value = None
+        self._expires = 0.0
+        client = self._get_redis()
+        if client is not None:
+            try:
+                client.delete(self.REDIS_KEY)
+            except Exception as e:
+                logger.warning(f"Error invalidating Gofile server in Redis: {str(e)}")
+    
+    def _cached(self):
+        """Return (server, seconds until expiry) from memory or Redis, or (None, 0)."""
+        remaining = self._expires - time.monotonic()
+        if self._value is not None and remaining > 0:
+            return self._value, remaining
+        
+        client = self._get_redis()
+        if client is not None:
+            try:
+                value, ttl = client.pipeline().get(self.REDIS_KEY).ttl(self.REDIS_KEY).execute()
+                if value is not None and ttl > 0:
+                    self._store_local(value.decode('utf-8'), ttl)
+                    return self._value, ttl
+            except Exception as e:
+                logger.warning(f"Error reading Gofile server from Redis: {str(e)}")
+        return None, 0
+    
+    def _refresh(self):
+        """Fetch the server upstream (once across processes) and cache it. Caller holds _refresh_lock."""
+        client = self._get_redis()
+        token = None
+        if client is not None:
+            try:
+                token = uuid.uuid4().hex
+                if not client.set(self.REDIS_LOCK_KEY, token, nx=True, ex=30):
+                    token = None
+                    value = self._wait_for_refresh(client)
+                    if value is not None:
+                        return value
+            except Exception as e:
+                logger.warning(f"Error coordinating Gofile server refresh through Redis: {str(e)}")
+        
         try:
-            response = requests.get(f"{GOFILE_API_URL}/getServer", headers=headers)
-            response.raise_for_status()
-            
-            data = response.json()
-            if data['status'] == 'ok':
-                return data['data']['server']
-            else:
-                error_msg = f"Gofile API error: {data.get('message', 'Unknown error')}"
-                logger.error(error_msg)
-                raise ValueError(error_msg)
-                
-        except (requests.RequestException, ValueError) as e:
-            retry_count += 1
-            wait_time = retry_count * 2  # Exponential backoff
-            logger.warning(f"Error getting Gofile server (attempt {retry_count}/{max_retries}): {str(e)}")
-            
-            if retry_count < max_retries:
-                logger.info(f"Retrying in {wait_time} seconds...")
-                time.sleep(wait_time)
-            else:
-                raise RuntimeError(f"Failed to get Gofile server after {max_retries} attempts: {str(e)}")
-    
-    # This should not be reached due to the raise in the loop
-    raise RuntimeError("Failed to get Gofile server")
+            self.upstream_calls += 1
+            value = self._fetch()
+            self._store_local(value, self.ttl)
+            if client is not None:
+                try:
+                    client.set(self.REDIS_KEY, value, ex=self.ttl)
+                except Exception as e:
+                    logger.warning(f"Error writing Gofile server to Redis: {str(e)}")
+            return value
+        finally:
+            if token is not None:
+                try:
+                    # Only release the lock if it is still ours (it may have expired and been taken over)
+                    client.eval(self.RELEASE_LOCK_SCRIPT, 1, self.REDIS_LOCK_KEY, token)
+                except Exception:
+                    pass
+    
+    def _wait_for_refresh(self, client):
+        """
+        Wait briefly for the process holding the lock to store a new server; returns it, or None.
+        
+        During a refresh-ahead Redis still holds the old entry, so only an
+        entry with more than `refresh_ahead` seconds left counts as new.
+        """
+        deadline = time.monotonic() + 10
+        while time.monotonic() < deadline:
+            time.sleep(0.05)
+            value, ttl = client.pipeline().get(self.REDIS_KEY).ttl(self.REDIS_KEY).execute()
+            if value is not None and ttl > self.refresh_ahead:
+                self._store_local(value.decode('utf-8'), ttl)
+                return self._value
+        return None
+    
+    def _background_refresh(self):
+        try:
+            self._refresh()
+        except Exception as e:
+            logger.warning(f"Background refresh of Gofile server failed: {str(e)}")
+        finally:
+            self._refresh_lock.release()
+    
+    def _store_local(self, value, ttl):
+        self._value = value
+        self._expires = time.monotonic() + ttl
+    
+    def _get_redis(self):
+        if not self._redis_url:
+            return None
+        if self._redis is None:
+            import redis
+            self._redis = redis.Redis.from_url(self._redis_url, socket_connect_timeout=1, socket_timeout=1)
+        return self._redis
+
+_server_cache = ServerCache(
+    fetch_gofile_server,
+    ttl=Config.GOFILE_SERVER_TTL,
+    refresh_ahead=Config.GOFILE_SERVER_REFRESH_AHEAD,
+    redis_url=Config.GOFILE_SERVER_CACHE_REDIS_URL or None
+)
+
+def get_gofile_server():
+    """Get the best Gofile server for uploads (cached, see ServerCache)."""
+    return _server_cache.get()
 
 def add_to_account(file_id):
     """Add a file to user's Gofile account using the API token."""
@@ -77,128 +232,188 @@ def add_to_account(file_id):
         logger.warning(f"Error adding file to account: {str(e)}")
         return False
 
+# Adding uploads to the account is follow-up work that does not need to
+# hold up the upload; by default it runs on a small thread pool, and the
+# Celery worker swaps in a task of its own with set_account_dispatcher().
+_account_executor = None
+_account_dispatcher = None
+
+def set_account_dispatcher(dispatcher):
+    """Use `dispatcher(file_id)` to schedule add_to_account calls (None restores the thread pool)."""
+    global _account_dispatcher
+    _account_dispatcher = dispatcher
+
+def add_to_account_later(file_id):
+    """Schedule add_to_account(file_id) without waiting for it."""
+    global _account_executor
+    if not GOFILE_API_TOKEN:
+        return
+    try:
+        if _account_dispatcher is not None:
+            _account_dispatcher(file_id)
+            return
+    except Exception as e:
+        logger.warning(f"Error dispatching add_to_account for {file_id}, running it in the background: {str(e)}")
+    if _account_executor is None:
+        from concurrent.futures import ThreadPoolExecutor
+        _account_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='gofile-account')
+    _account_executor.submit(add_to_account, file_id)
+
 def download_from_gofile(file_id, output_path):
-    """Download a file from Gofile using the file ID."""
+    """
+    Download a file from Gofile using the file ID.
+    
+    Makes a single attempt (the transfer itself resumes after interruptions);
+    transient failures raise TransientError for the caller to retry later.
+    """
     if not file_id:
         raise ValueError("No file ID provided")
-        
-    max_retries = 3
-    retry_count = 0
     
     # Prepare headers with API token if available
     headers = {}
     if GOFILE_API_TOKEN:
         headers['Authorization'] = f'Bearer {GOFILE_API_TOKEN}'
     
-    while retry_count < max_retries:
-        try:
-            # Get file info
-            response = requests.get(
-                f"{GOFILE_API_URL}/contents/{file_id}",
-                headers=headers
-            )
-            response.raise_for_status()
-            
-            data = response.json()
-            if data['status'] != 'ok':
-                raise ValueError(f"Gofile API error: {data.get('message', 'Unknown error')}")
-                
-            download_url = data['data']['contents']['file']['directLink']
-            
-            # Download the file
-            with requests.get(download_url, stream=True) as r:
-                r.raise_for_status()
-                with open(output_path, 'wb') as f:
-                    for chunk in r.iter_content(chunk_size=8192):
-                        f.write(chunk)
-                        
-            logger.info(f"File downloaded successfully to {output_path}")
-            return True
-            
-        except Exception as e:
-            retry_count += 1
-            wait_time = retry_count * 2
-            logger.warning(f"Error downloading from Gofile (attempt {retry_count}/{max_retries}): {str(e)}")
-            
-            if retry_count < max_retries:
-                logger.info(f"Retrying in {wait_time} seconds...")
-                time.sleep(wait_time)
-            else:
-                raise RuntimeError(f"Failed to download file from Gofile after {max_retries} attempts: {str(e)}")
+    try:
+        # Get file info
+        response = requests.get(
+            f"{GOFILE_API_URL}/contents/{file_id}",
+            headers=headers,
+            timeout=Config.DOWNLOAD_TIMEOUT
+        )
+        response.raise_for_status()
+        data = response.json()
+    except requests.RequestException as e:
+        logger.warning(f"Error getting Gofile file info for {file_id}: {str(e)}")
+        raise wrap_request_error(e, f"Failed to get Gofile file info for {file_id}") from e
+    
+    if data['status'] != 'ok':
+        raise ValueError(f"Gofile API error: {data.get('message', 'Unknown error')}")
     
-    return False
+    download_url = data['data']['contents']['file']['directLink']
+    
+    # Download the file (in parallel ranges, resuming after transient errors)
+    download(download_url, output_path, headers=headers)
+    
+    logger.info(f"File downloaded successfully to {output_path}")
+    return True
 
-def upload_to_gofile(file_path, filename=None):
-    """Upload a file to Gofile and return the download link."""
-    if not os.path.exists(file_path):
-        raise ValueError(f"File not found: {file_path}")
+@contextlib.contextmanager
+def open_upload(file):
+    """
+    Open something to upload as a binary stream positioned at the start.
     
-    if not filename:
-        filename = os.path.basename(file_path)
+    Accepts a file path, bytes, or a seekable binary file-like object (which
+    is left open for the caller).
+    """
+    if isinstance(file, (str, os.PathLike)):
+        with open(file, 'rb') as f:
+            yield f
+    elif isinstance(file, (bytes, bytearray, memoryview)):
+        yield io.BytesIO(file)
+    else:
+        file.seek(0)
+        yield file
+
+def upload_to_gofile(file, filename=None, server=None, folder_id=None, guest_token=None):
+    """
+    Upload a file to Gofile and return the download link.
+    
+    Args:
+        file: Path to the file to upload, or its content as bytes or a binary stream
+        filename: Name to give the file on Gofile (defaults to the base name of the path)
+        server: Gofile server to use (looked up if not given)
+        folder_id: Existing Gofile folder to upload into
+        guest_token: Guest token returned by an earlier upload into folder_id, when no API token is set
+    """
+    if isinstance(file, (str, os.PathLike)):
+        if not os.path.exists(file):
+            raise ValueError(f"File not found: {file}")
+        if not filename:
+            filename = os.path.basename(file)
+    elif not filename:
+        raise ValueError("A filename is required when uploading from memory")
     
     # Get the best server
-    server = get_gofile_server()
+    if not server:
+        server = get_gofile_server()
     logger.info(f"Using Gofile server: {server}")
     
-    # Upload the file
-    max_retries = 3
-    retry_count = 0
-    
     # Prepare headers with API token if available
     headers = {}
     if GOFILE_API_TOKEN:
         headers['Authorization'] = f'Bearer {GOFILE_API_TOKEN}'
     
-    while retry_count < max_retries:
-        try:
-            with open(file_path, 'rb') as f:
-                files = {'file': (filename, f)}
-                data = {}
-                
-                # Add token to form data as well (Gofile supports both methods)
-                if GOFILE_API_TOKEN:
-                    data['token'] = GOFILE_API_TOKEN
-                
-                response = requests.post(
-                    f"https://{server}.gofile.io/uploadFile", 
-                    files=files,
-                    data=data,
-                    headers=headers
-                )
-                response.raise_for_status()
-                
-                data = response.json()
-                if data['status'] == 'ok':
-                    logger.info(f"File uploaded successfully to Gofile: {filename}")
-                    result = {
-                        'fileId': data['data']['fileId'],
-                        'fileName': data['data']['fileName'],
-                        'downloadPage': data['data']['downloadPage']
-                    }
-                    
-                    # If we have a token, add the file to account
-                    if GOFILE_API_TOKEN and 'fileId' in data['data']:
-                        try:
-                            add_to_account(data['data']['fileId'])
-                        except Exception as e:
-                            logger.warning(f"Failed to add file to account: {e}")
-                    
-                    return result
-                else:
-                    error_msg = f"Gofile upload error: {data.get('message', 'Unknown error')}"
-                    logger.error(error_msg)
-                    raise ValueError(error_msg)
-                    
-        except (requests.RequestException, ValueError) as e:
-            retry_count += 1
-            wait_time = retry_count * 2  # Exponential backoff
-            logger.warning(f"Error uploading to Gofile (attempt {retry_count}/{max_retries}): {str(e)}")
+    # Upload the file (a single attempt: transient failures raise TransientError)
+    try:
+        with open_upload(file) as f:
+            files = {'file': (filename, f)}
+            data = {}
+            
+            # Add token to form data as well (Gofile supports both methods)
+            if GOFILE_API_TOKEN:
+                data['token'] = GOFILE_API_TOKEN
+            elif guest_token:
+                data['token'] = guest_token
+            
+            if folder_id:
+                data['folderId'] = folder_id
             
-            if retry_count < max_retries:
-                logger.info(f"Retrying in {wait_time} seconds...")
-                time.sleep(wait_time)
-            else:
-                raise RuntimeError(f"Failed to upload file to Gofile after {max_retries} attempts: {str(e)}")
-    
-    # This should not be reached due to the raise in the loop
-    raise RuntimeError("Failed to upload file to Gofile")
+            response = requests.post(
+                f"https://{server}.gofile.io/uploadFile", 
+                files=files,
+                data=data,
+                headers=headers
+            )
+            response.raise_for_status()
+            data = response.json()
+    except requests.RequestException as e:
+        logger.warning(f"Error uploading {filename} to Gofile: {str(e)}")
+        # The cached server may have gone away; look it up again next time
+        _server_cache.invalidate()
+        raise wrap_request_error(e, f"Failed to upload {filename} to Gofile") from e
+    
+    if data['status'] != 'ok':
+        error_msg = f"Gofile upload error: {data.get('message', 'Unknown error')}"
+        logger.error(error_msg)
+        raise ValueError(error_msg)
+    
+    logger.info(f"File uploaded successfully to Gofile: {filename}")
+    result = {
+        'fileId': data['data']['fileId'],
+        'fileName': data['data']['fileName'],
+        'downloadPage': data['data']['downloadPage'],
+        'parentFolder': data['data'].get('parentFolder'),
+        'guestToken': data['data'].get('guestToken', guest_token)
+    }
+    
+    # If we have a token, add the file to account (in the background)
+    if GOFILE_API_TOKEN and 'fileId' in data['data']:
+        add_to_account_later(data['data']['fileId'])
+    
+    return result
+
+def upload_many_to_gofile(files):
+    """
+    Upload several files to Gofile as one batch.
+    
+    All files go to the same server and into the folder created by the first
+    upload, so the server lookup happens once.
+    
+    Args:
+        files: List of (file, filename) tuples, where file is a path, bytes or a binary stream
+    
+    Returns a list of upload results, in the same order as `files`.
+    """
+    server = get_gofile_server()
+    folder_id = None
+    guest_token = None
+    results = []
+    
+    for file, filename in files:
+        result = upload_to_gofile(file, filename, server=server, folder_id=folder_id, guest_token=guest_token)
+        folder_id = folder_id or result.get('parentFolder')
+        guest_token = guest_token or result.get('guestToken')
+        results.append(result)
+    
+    return results
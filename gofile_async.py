@@ -0,0 +1,172 @@
+import os
+import asyncio
+import logging
+import threading
+import aiohttp
+from config import Config
+from errors import TRANSIENT_HTTP_STATUSES, TransientNetworkError
+from gofile_api import (
+    GOFILE_API_TOKEN, open_upload, get_gofile_server,
+    add_to_account_later, _server_cache
+)
+
+# Configure logging
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+
+class AsyncGofileClient:
+    """
+    asyncio client for the Gofile API.
+
+    Keeps one aiohttp session (and its connection pool) for the life of the
+    event loop, and sends uploads as a streaming multipart body read from the
+    file in chunks, so files are never held in memory whole. Uploads return
+    the same results and raise the same errors as the functions in gofile_api.
+    """
+
+    def __init__(self, pool_size=None):
+        self.pool_size = pool_size or Config.GOFILE_POOL_SIZE
+        self._session = None
+
+    async def get_session(self):
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size, ttl_dns_cache=300),
+                timeout=aiohttp.ClientTimeout(total=None, sock_connect=30, sock_read=Config.DOWNLOAD_TIMEOUT)
+            )
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+    async def get_server(self):
+        """Return the upload server from the shared server cache, without blocking the loop."""
+        return await asyncio.get_running_loop().run_in_executor(None, get_gofile_server)
+
+    async def upload(self, file, filename=None, server=None, folder_id=None, guest_token=None):
+        """
+        Upload a file to Gofile and return the download link.
+
+        Args:
+            file: Path to the file to upload, or its content as bytes or a binary stream
+            filename: Name to give the file on Gofile (defaults to the base name of the path)
+            server: Gofile server to use (looked up if not given)
+            folder_id: Existing Gofile folder to upload into
+            guest_token: Guest token returned by an earlier upload into folder_id, when no API token is set
+        """
+        if isinstance(file, (str, os.PathLike)):
+            if not os.path.exists(file):
+                raise ValueError(f"File not found: {file}")
+            if not filename:
+                filename = os.path.basename(file)
+        elif not filename:
+            raise ValueError("A filename is required when uploading from memory")
+
+        if not server:
+            server = await self.get_server()
+        logger.info(f"Using Gofile server: {server}")
+
+        headers = {}
+        if GOFILE_API_TOKEN:
+            headers['Authorization'] = f'Bearer {GOFILE_API_TOKEN}'
+
+        session = await self.get_session()
+        # A single attempt: transient failures raise TransientError, as in gofile_api
+        try:
+            with open_upload(file) as f:
+                form = aiohttp.FormData()
+                if GOFILE_API_TOKEN:
+                    form.add_field('token', GOFILE_API_TOKEN)
+                elif guest_token:
+                    form.add_field('token', guest_token)
+                if folder_id:
+                    form.add_field('folderId', folder_id)
+                # A file object becomes a streamed payload part
+                form.add_field('file', f, filename=filename, content_type='application/octet-stream')
+
+                async with session.post(f"https://{server}.gofile.io/uploadFile", data=form, headers=headers) as response:
+                    response.raise_for_status()
+                    data = await response.json()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.warning(f"Error uploading {filename} to Gofile: {str(e)}")
+            _server_cache.invalidate()
+            if isinstance(e, aiohttp.ClientResponseError) and e.status not in TRANSIENT_HTTP_STATUSES:
+                raise
+            raise TransientNetworkError(f"Failed to upload {filename} to Gofile: {str(e)}") from e
+
+        if data['status'] != 'ok':
+            error_msg = f"Gofile upload error: {data.get('message', 'Unknown error')}"
+            logger.error(error_msg)
+            raise ValueError(error_msg)
+
+        logger.info(f"File uploaded successfully to Gofile: {filename}")
+        if GOFILE_API_TOKEN and 'fileId' in data['data']:
+            add_to_account_later(data['data']['fileId'])
+        return {
+            'fileId': data['data']['fileId'],
+            'fileName': data['data']['fileName'],
+            'downloadPage': data['data']['downloadPage'],
+            'parentFolder': data['data'].get('parentFolder'),
+            'guestToken': data['data'].get('guestToken', guest_token)
+        }
+
+    async def upload_many(self, files):
+        """
+        Upload several files to Gofile as one batch.
+
+        The first upload creates the folder; the rest are sent concurrently
+        into it over the shared connection pool.
+
+        Args:
+            files: List of (file, filename) tuples, where file is a path, bytes or a binary stream
+
+        Returns a list of upload results, in the same order as `files`.
+        """
+        if not files:
+            return []
+        server = await self.get_server()
+        first = await self.upload(files[0][0], files[0][1], server=server)
+        rest = await asyncio.gather(*(
+            self.upload(file, filename, server=server, folder_id=first.get('parentFolder'),
+                        guest_token=first.get('guestToken'))
+            for file, filename in files[1:]
+        ))
+        return [first] + list(rest)
+
+
+# One event loop thread and client per process, so the connection pool
+# outlives individual calls from synchronous code
+_loop = None
+_loop_pid = None
+_client = None
+_loop_lock = threading.Lock()
+
+
+def get_client():
+    """Return the process-wide async client and the event loop it runs on."""
+    global _loop, _loop_pid, _client
+    with _loop_lock:
+        if _loop is None or _loop_pid != os.getpid():
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name='gofile-async', daemon=True).start()
+            _loop_pid = os.getpid()
+            _client = AsyncGofileClient()
+        return _client, _loop
+
+
+def run(coroutine_function, *args, **kwargs):
+    """Run a client coroutine on the background loop and wait for its result."""
+    client, loop = get_client()
+    return asyncio.run_coroutine_threadsafe(coroutine_function(client, *args, **kwargs), loop).result()
+
+
+def upload_to_gofile(file, filename=None, server=None, folder_id=None, guest_token=None):
+    """Synchronous equivalent of gofile_api.upload_to_gofile, using the async client."""
+    return run(AsyncGofileClient.upload, file, filename, server=server, folder_id=folder_id, guest_token=guest_token)
+
+
+def upload_many_to_gofile(files):
+    """Synchronous equivalent of gofile_api.upload_many_to_gofile, using the async client."""
+    return run(AsyncGofileClient.upload_many, files)
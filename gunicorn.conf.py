@@ -0,0 +1,12 @@
+import os
+
+# Gunicorn settings for the web app (gunicorn --config gunicorn.conf.py main:app).
+# Each open /api/task/<id>/events stream holds a worker thread for up to
+# TASK_EVENTS_MAX_SECONDS, so the app runs on threaded workers; keep that
+# limit below `timeout`, and TASK_EVENTS_MAX_STREAMS (the number of streams a
+# worker serves at once) below `threads`.
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+worker_class = 'gthread'
+workers = int(os.environ.get('GUNICORN_WORKERS', '1'))
+threads = int(os.environ.get('GUNICORN_THREADS', '32'))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '30'))
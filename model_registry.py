@@ -0,0 +1,241 @@
+import gc
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+import whisper
+from config import Config
+
+# Configure logging
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+
+def get_rss_bytes():
+    """Return the resident set size of the current process in bytes."""
+    try:
+        with open('/proc/self/statm') as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        # Not on Linux: fall back to the peak RSS reported by the kernel
+        import resource
+        import sys
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def get_memory_sharing():
+    """
+    Return how much of this process' memory is shared with other processes.
+
+    Reads /proc/self/smaps_rollup (Linux 4.14+). Values are in bytes; returns
+    an empty dictionary when the information is not available.
+    """
+    fields = {
+        'Rss': 'rss_bytes',
+        'Pss': 'pss_bytes',
+        'Shared_Clean': 'shared_clean_bytes',
+        'Shared_Dirty': 'shared_dirty_bytes',
+        'Private_Clean': 'private_clean_bytes',
+        'Private_Dirty': 'private_dirty_bytes',
+    }
+    report = {}
+    try:
+        with open('/proc/self/smaps_rollup') as f:
+            for line in f:
+                key, _, value = line.partition(':')
+                if key in fields:
+                    report[fields[key]] = int(value.split()[0]) * 1024
+    except (OSError, ValueError):
+        return {}
+    report['shared_bytes'] = report.get('shared_clean_bytes', 0) + report.get('shared_dirty_bytes', 0)
+    report['private_bytes'] = report.get('private_clean_bytes', 0) + report.get('private_dirty_bytes', 0)
+    return report
+
+
+def get_model_bytes(model):
+    """Return the memory taken by the parameters and buffers of a torch model in bytes."""
+    tensors = list(model.parameters()) + list(model.buffers()) if hasattr(model, 'parameters') else []
+    return sum(tensor.nelement() * tensor.element_size() for tensor in tensors)
+
+
+class ModelRegistry:
+    """
+    Keep loaded Whisper models in memory, keyed by model name.
+
+    The size of each model's weights is recorded when it is loaded. When the
+    loaded models together go over the memory budget, the least recently used
+    ones are evicted until they fit again. The budget does not count the rest
+    of the process (audio buffers, allocator slack), which evicting models
+    would not shrink anyway. The model that was just requested is never
+    evicted, and neither are preloaded models: those live in pages shared
+    with the parent process, so dropping them in a child would not give any
+    memory back.
+    """
+
+    def __init__(self, memory_budget_bytes=None, loader=None):
+        self.memory_budget_bytes = memory_budget_bytes
+        self._loader = loader or whisper.load_model
+        self._models = OrderedDict()
+        self._model_bytes = {}
+        self._pinned = set()
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.load_seconds = 0.0
+
+    def get(self, model_name):
+        """Return the model for `model_name`, loading it on first use."""
+        with self._lock:
+            model = self._models.get(model_name)
+            if model is not None:
+                self._models.move_to_end(model_name)
+                self.hits += 1
+                return model
+
+            self.misses += 1
+            logger.info(f"Loading Whisper model: {model_name}")
+            started = time.perf_counter()
+            model = self._loader(model_name)
+            elapsed = time.perf_counter() - started
+            self.load_seconds += elapsed
+            self._models[model_name] = model
+            self._model_bytes[model_name] = get_model_bytes(model)
+            logger.info(f"Loaded Whisper model {model_name} in {elapsed:.2f}s "
+                        f"({self._model_bytes[model_name] / (1024 * 1024):.0f} MB)")
+
+            self._enforce_budget(keep=model_name)
+            return model
+
+    def preload(self, model_names):
+        """
+        Load `model_names` and pin them so they are never evicted.
+
+        Meant to run in the Celery parent before the pool forks, so that the
+        children share the weights copy-on-write instead of loading their own.
+        """
+        try:
+            import torch
+        except ImportError:
+            torch = None
+
+        if torch is not None and torch.cuda.is_available():
+            # CUDA state cannot be inherited across fork()
+            logger.warning("CUDA is available; skipping preload of Whisper models before fork")
+            return []
+
+        # Keep torch from starting its intra-op thread pool in the parent: a
+        # pool created before fork() can deadlock in the children.
+        num_threads = torch.get_num_threads() if torch is not None else None
+        if torch is not None:
+            torch.set_num_threads(1)
+        try:
+            for model_name in model_names:
+                self.get(model_name)
+                with self._lock:
+                    self._pinned.add(model_name)
+        finally:
+            if torch is not None:
+                torch.set_num_threads(num_threads)
+
+        # Move everything allocated so far out of the collector's reach, so
+        # gc passes in the children do not write to (and un-share) its pages.
+        gc.freeze()
+        return list(model_names)
+
+    def evict(self, model_name):
+        """Drop a model from the registry. Returns True if it was loaded."""
+        with self._lock:
+            model = self._models.pop(model_name, None)
+            if model is None:
+                return False
+            self._model_bytes.pop(model_name, None)
+            self._pinned.discard(model_name)
+            del model
+            self.evictions += 1
+            self._release_memory()
+            logger.info(f"Evicted Whisper model: {model_name}")
+            return True
+
+    def clear(self):
+        """Drop every loaded model."""
+        with self._lock:
+            for model_name in list(self._models):
+                self.evict(model_name)
+
+    def loaded_models(self):
+        """Return loaded model names, least recently used first."""
+        with self._lock:
+            return list(self._models)
+
+    def model_bytes(self, model_name):
+        """Return the size of a loaded model in bytes, or None if it is not loaded."""
+        with self._lock:
+            return self._model_bytes.get(model_name)
+
+    def loaded_bytes(self):
+        """Return the total size of the loaded models in bytes."""
+        with self._lock:
+            return sum(self._model_bytes.values())
+
+    def stats(self):
+        """Return the registry counters as a dictionary."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'loaded_models': list(self._models),
+                'preloaded_models': sorted(self._pinned),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'load_seconds': round(self.load_seconds, 3),
+                'model_bytes': sum(self._model_bytes.values()),
+                'rss_bytes': get_rss_bytes(),
+                'memory_budget_bytes': self.memory_budget_bytes,
+            }
+
+    def _enforce_budget(self, keep):
+        if not self.memory_budget_bytes:
+            return
+        while self.loaded_bytes() > self.memory_budget_bytes:
+            victim = next(
+                (name for name in self._models if name != keep and name not in self._pinned),
+                None
+            )
+            if victim is None:
+                logger.warning(
+                    f"Loaded Whisper models cannot be evicted below the memory budget "
+                    f"of {self.memory_budget_bytes // (1024 * 1024)} MB"
+                )
+                break
+            self.evict(victim)
+
+    @staticmethod
+    def _release_memory():
+        gc.collect()
+        try:
+            import torch
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+        except ImportError:
+            pass
+
+
+# Process-wide registry used by the worker
+_registry = ModelRegistry(memory_budget_bytes=Config.WHISPER_MODEL_MEMORY_BUDGET_MB * 1024 * 1024 or None)
+
+
+def get_registry():
+    """Return the process-wide model registry."""
+    return _registry
+
+
+def get_model(model_name):
+    """Return a loaded Whisper model from the process-wide registry."""
+    return _registry.get(model_name)
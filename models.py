@@ -1,8 +1,16 @@
+import json
+import zlib
 import datetime
-from app import db
+from database import db
+from config import Config
 
 class SubtitleTask(db.Model):
     """Model to store subtitle generation task information."""
+    __table_args__ = (
+        # Serves the per-session task list, newest first (see /api/my-tasks)
+        db.Index('ix_subtitle_task_session_created', 'session_id', 'created_at'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     task_id = db.Column(db.String(255), unique=True, nullable=False)
     session_id = db.Column(db.String(255), nullable=False)
@@ -18,6 +26,8 @@ class SubtitleTask(db.Model):
     output_language = db.Column(db.String(10), nullable=True, default='same')
     model = db.Column(db.String(20), nullable=False, default='base')
     format_type = db.Column(db.String(10), nullable=False, default='srt')
+    # Every requested format, comma-separated (format_type holds the first one)
+    formats = db.Column(db.String(64), nullable=True)
     
     # Celery task status
     celery_status = db.Column(db.String(50), nullable=True)
@@ -27,18 +37,97 @@ class SubtitleTask(db.Model):
     subtitle_gofile_id = db.Column(db.String(255), nullable=True)
     subtitle_gofile_link = db.Column(db.String(512), nullable=True)
     subtitle_filename = db.Column(db.String(255), nullable=True)
+    # JSON object mapping each format to its uploaded file: {format: {fileId, link, filename}}
+    subtitle_outputs = db.Column(db.Text, nullable=True)
+    
+    # Transcribed segments as zlib-compressed JSON [[start_ms, end_ms, text], ...],
+    # loaded only when accessed
+    segments_data = db.deferred(db.Column(db.LargeBinary, nullable=True))
+    segment_count = db.Column(db.Integer, nullable=True)
+    
+    # Input download statistics
+    download_bytes = db.Column(db.BigInteger, nullable=True)
+    download_seconds = db.Column(db.Float, nullable=True)
+    
+    # Audio statistics (seconds of input audio, and how much of it VAD skipped)
+    audio_duration = db.Column(db.Float, nullable=True)
+    skipped_audio_seconds = db.Column(db.Float, nullable=True)
+    
+    # Staged pipeline: the stage running or last handed off, and per stage
+    # timings as JSON {stage: {"wait": queue seconds, "seconds": run seconds}}
+    stage = db.Column(db.String(20), nullable=True)
+    stage_timings = db.Column(db.Text, nullable=True)
     
     # Timestamps
     created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+    # Indexed for the "changed since" lookups of /api/tasks/status
+    updated_at = db.Column(db.DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow, index=True)
     completed_at = db.Column(db.DateTime, nullable=True)
     
     # Error handling
     message = db.Column(db.Text, nullable=True)
     
+    # Fields of to_dict, which /api/task/<id> can project with `fields=`
+    TASK_FIELDS = (
+        'id', 'task_id', 'status', 'celery_status', 'progress', 'original_filename', 'input_gofile_link',
+        'language', 'output_language', 'model', 'format_type', 'formats', 'subtitle_gofile_link',
+        'subtitle_filename', 'subtitle_outputs', 'download_bytes', 'download_throughput', 'audio_duration',
+        'skipped_audio_seconds', 'available_formats', 'stage', 'stage_timings', 'created_at', 'completed_at',
+        'message', 'updated_at'
+    )
+    
+    # Columns of the task list projection (see list_dict)
+    LIST_FIELDS = ('id', 'task_id', 'status', 'progress', 'original_filename', 'subtitle_gofile_link', 'created_at')
+    
+    # Columns of the compact status projection (see status_dict)
+    STATUS_FIELDS = ('task_id', 'status', 'celery_status', 'progress', 'stage', 'subtitle_gofile_link', 'updated_at')
+    
     def __repr__(self):
         return f"<SubtitleTask {self.task_id} ({self.status})>"
     
+    def get_formats(self):
+        """Return the requested output formats."""
+        if self.formats:
+            return self.formats.split(',')
+        return [self.format_type]
+    
+    def get_outputs(self):
+        """Return the uploaded subtitle files keyed by format."""
+        return json.loads(self.subtitle_outputs) if self.subtitle_outputs else {}
+    
+    def set_outputs(self, outputs):
+        """Record the uploaded subtitle files keyed by format."""
+        self.subtitle_outputs = json.dumps(outputs)
+    
+    def get_stage_timings(self):
+        """Return the recorded stage timings."""
+        return json.loads(self.stage_timings) if self.stage_timings else {}
+    
+    def record_stage(self, stage, seconds, wait=None):
+        """Record how long a stage ran and how long it waited after the previous handoff (kept if not given)."""
+        timings = self.get_stage_timings()
+        if wait is None:
+            wait = timings.get(stage, {}).get('wait')
+        timings[stage] = {'wait': round(wait, 3) if wait is not None else None, 'seconds': round(seconds, 3)}
+        self.stage_timings = json.dumps(timings)
+    
+    def set_segments(self, segments):
+        """Store transcribed segments in compact form."""
+        rows = [
+            [int(round(segment['start'] * 1000)), int(round(segment['end'] * 1000)), segment['text']]
+            for segment in segments
+        ]
+        self.segments_data = zlib.compress(json.dumps(rows, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+        self.segment_count = len(rows)
+    
+    def get_segments(self):
+        """Return the stored segments, or None if the task has none."""
+        return unpack_segments(self.segments_data)
+    
+    def available_formats(self):
+        """Return the subtitle formats that can be rendered for this task."""
+        return list(Config.SUBTITLE_FORMATS) if self.segment_count is not None else []
+    
     def to_dict(self):
         """Convert the model to a dictionary."""
         return {
@@ -53,9 +142,41 @@ class SubtitleTask(db.Model):
             'output_language': self.output_language,
             'model': self.model,
             'format_type': self.format_type,
+            'formats': self.get_formats(),
             'subtitle_gofile_link': self.subtitle_gofile_link,
             'subtitle_filename': self.subtitle_filename,
+            'subtitle_outputs': self.get_outputs(),
+            'download_bytes': self.download_bytes,
+            'download_throughput': self.download_bytes / self.download_seconds if self.download_seconds else None,
+            'audio_duration': self.audio_duration,
+            'skipped_audio_seconds': self.skipped_audio_seconds,
+            'available_formats': self.available_formats(),
+            'stage': self.stage,
+            'stage_timings': self.get_stage_timings(),
             'created_at': self.created_at.strftime('%Y-%m-%d %H:%M:%S') if self.created_at else None,
             'completed_at': self.completed_at.strftime('%Y-%m-%d %H:%M:%S') if self.completed_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
             'message': self.message
         }
+
+def unpack_segments(data):
+    """Decode segments stored by SubtitleTask.set_segments."""
+    if data is None:
+        return None
+    return [
+        {'start': start / 1000, 'end': end / 1000, 'text': text}
+        for start, end, text in json.loads(zlib.decompress(data).decode('utf-8'))
+    ]
+
+def status_dict(row):
+    """Convert a row of SubtitleTask.STATUS_FIELDS columns to a dictionary."""
+    status = dict(zip(SubtitleTask.STATUS_FIELDS, row))
+    status['updated_at'] = status['updated_at'].isoformat() if status['updated_at'] else None
+    return status
+
+def list_dict(row):
+    """Convert a row of SubtitleTask.LIST_FIELDS columns to a dictionary (without the row id)."""
+    task = dict(zip(SubtitleTask.LIST_FIELDS, row))
+    del task['id']
+    task['created_at'] = task['created_at'].strftime('%Y-%m-%d %H:%M:%S') if task['created_at'] else None
+    return task
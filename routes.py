@@ -4,10 +4,11 @@ import logging
 import tempfile
 from pathlib import Path
 from datetime import datetime
-from flask import Blueprint, render_template, request, redirect, url_for, session, flash, send_file, jsonify
+from flask import Blueprint, render_template, request, redirect, url_for, session, flash, send_file, jsonify, abort
 from werkzeug.utils import secure_filename
 from app import db
 from models import SubtitleTask
+from storage import LocalStorage, get_storage
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
@@ -119,3 +120,16 @@ def download_result():
     
     # Redirect to the Gofile download link
     return redirect(task.subtitle_gofile_link)
+
+@main_bp.route('/files/<file_id>/<filename>')
+def stored_file(file_id, filename):
+    """Serve a file from the local storage backend."""
+    storage = get_storage()
+    if not isinstance(storage, LocalStorage):
+        abort(404)
+    
+    path = storage.path_for(file_id, filename)
+    if not path or not os.path.exists(path):
+        abort(404)
+    
+    return send_file(path, as_attachment=True, download_name=filename)
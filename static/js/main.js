@@ -246,8 +246,7 @@ document.addEventListener('DOMContentLoaded', function() {
                 updateTaskUI(task);
                 
                 // If task is still in progress, check again after a delay
-                if (task.status === 'pending' || task.celery_status === 'STARTED' || 
-                    task.celery_status === 'PROCESSING' || task.celery_status === 'UPLOADING') {
+                if (!isTaskFinished(task)) {
                     setTimeout(checkTaskStatus, 5000);
                 }
                 
@@ -274,6 +273,19 @@ document.addEventListener('DOMContentLoaded', function() {
                     resultLinkContainer.classList.remove('d-none');
                 }
                 
+                // Link the other formats produced by the same task
+                const extraResultLinks = document.getElementById('extraResultLinks');
+                const outputs = task.subtitle_outputs || {};
+                if (extraResultLinks) {
+                    extraResultLinks.innerHTML = Object.keys(outputs)
+                        .filter(format => outputs[format].link !== task.subtitle_gofile_link)
+                        .map(format => `
+                            <a href="${outputs[format].link}" target="_blank" class="btn btn-outline-primary me-2 mt-2">
+                                <i class="fas fa-download me-1"></i> ${format.toUpperCase()}
+                            </a>
+                        `).join('');
+                }
+                
                 // Update progress
                 if (progressElement) {
                     progressElement.style.width = '100%';
@@ -323,26 +335,75 @@ document.addEventListener('DOMContentLoaded', function() {
             }
         };
         
-        // Start checking status
-        checkTaskStatus();
+        const isTaskFinished = (task) => task.status === 'completed' || task.status === 'failed';
+        
+        // Follow the task through its event stream; fall back to polling
+        // when the browser or the server does not support it
+        const followTaskEvents = () => {
+            const source = new EventSource(`/api/task/${taskId}/events`);
+            let received = false;
+            // Events after the first may carry only the fields that changed
+            const task = {};
+            
+            source.onmessage = (event) => {
+                received = true;
+                Object.assign(task, JSON.parse(event.data));
+                updateTaskUI(task);
+                if (isTaskFinished(task)) {
+                    source.close();
+                }
+            };
+            
+            source.onerror = () => {
+                // EventSource reconnects by itself after a dropped stream; it
+                // gives up (CLOSED) on error responses, and a stream that never
+                // delivered anything is not worth retrying
+                if (source.readyState === EventSource.CLOSED || !received) {
+                    source.close();
+                    checkTaskStatus();
+                }
+            };
+        };
+        
+        // Start following the task
+        if (window.EventSource) {
+            followTaskEvents();
+        } else {
+            checkTaskStatus();
+        }
     }
     
     // Tasks list page
     const tasksListContainer = document.getElementById('tasksList');
     if (tasksListContainer) {
-        const loadTasks = async () => {
+        let nextCursor = null;
+        
+        // Load one page of tasks; without a cursor, start over from the newest
+        const loadTasks = async (cursor = null) => {
+            const loadMoreButton = document.getElementById('loadMoreTasks');
+            if (loadMoreButton) {
+                loadMoreButton.disabled = true;
+            }
+            
             try {
-                const response = await fetch('/api/my-tasks');
+                const url = cursor ? `/api/my-tasks?cursor=${encodeURIComponent(cursor)}` : '/api/my-tasks';
+                const response = await fetch(url);
                 const data = await response.json();
                 
                 if (data.status !== 'success') {
                     throw new Error(data.message || 'Failed to load tasks');
                 }
                 
-                renderTasksList(data.tasks);
+                nextCursor = data.next_cursor;
+                renderTasksList(data.tasks, Boolean(cursor));
                 
             } catch (error) {
                 console.error('Error loading tasks:', error);
+                if (cursor && loadMoreButton) {
+                    loadMoreButton.disabled = false;
+                    showFeedback(`Failed to load more tasks: ${error.message || 'Unknown error'}`, 'danger');
+                    return;
+                }
                 tasksListContainer.innerHTML = `
                     <div class="alert alert-danger">
                         Failed to load tasks: ${error.message || 'Unknown error'}
@@ -351,7 +412,58 @@ document.addEventListener('DOMContentLoaded', function() {
             }
         };
         
-        const renderTasksList = (tasks) => {
+        const renderTaskRow = (task) => {
+            const statusClass = task.status === 'completed' ? 'text-success' : 
+                                task.status === 'failed' ? 'text-danger' : 'text-warning';
+                                
+            let statusDisplay = task.status;
+            if (task.status === 'pending' && task.progress) {
+                statusDisplay = task.progress;
+            }
+            
+            return `
+                <tr>
+                    <td>${task.original_filename}</td>
+                    <td><span class="${statusClass} fw-bold">${statusDisplay}</span></td>
+                    <td>${task.created_at}</td>
+                    <td>
+                        <a href="/task/${task.task_id}" class="btn btn-sm btn-primary me-1" title="View Task Details">
+                            <i class="fas fa-eye"></i>
+                        </a>
+                        ${task.status === 'completed' ? `
+                            <a href="${task.subtitle_gofile_link}" target="_blank" class="btn btn-sm btn-success" title="Download Subtitles">
+                                <i class="fas fa-download me-1"></i>Download
+                            </a>
+                        ` : ''}
+                    </td>
+                </tr>
+            `;
+        };
+        
+        const renderLoadMore = () => {
+            const loadMoreContainer = document.getElementById('loadMoreContainer');
+            if (!loadMoreContainer) {
+                return;
+            }
+            loadMoreContainer.innerHTML = nextCursor ? `
+                <button id="loadMoreTasks" class="btn btn-outline-primary">
+                    <i class="fas fa-chevron-down me-1"></i> Load more
+                </button>
+            ` : '';
+            const loadMoreButton = document.getElementById('loadMoreTasks');
+            if (loadMoreButton) {
+                loadMoreButton.addEventListener('click', () => loadTasks(nextCursor));
+            }
+        };
+        
+        const renderTasksList = (tasks, append = false) => {
+            const tasksTableBody = document.getElementById('tasksTableBody');
+            if (append && tasksTableBody) {
+                tasksTableBody.insertAdjacentHTML('beforeend', tasks.map(renderTaskRow).join(''));
+                renderLoadMore();
+                return;
+            }
+            
             if (!tasks || tasks.length === 0) {
                 tasksListContainer.innerHTML = `
                     <div class="alert alert-info">
@@ -366,7 +478,7 @@ document.addEventListener('DOMContentLoaded', function() {
                 return;
             }
             
-            let html = `
+            tasksListContainer.innerHTML = `
                 <div class="table-responsive">
                     <table class="table table-hover">
                         <thead>
@@ -377,44 +489,14 @@ document.addEventListener('DOMContentLoaded', function() {
                                 <th>Actions</th>
                             </tr>
                         </thead>
-                        <tbody>
-            `;
-            
-            for (const task of tasks) {
-                const statusClass = task.status === 'completed' ? 'text-success' : 
-                                    task.status === 'failed' ? 'text-danger' : 'text-warning';
-                                    
-                let statusDisplay = task.status;
-                if (task.status === 'pending' && task.progress) {
-                    statusDisplay = task.progress;
-                }
-                
-                html += `
-                    <tr>
-                        <td>${task.original_filename}</td>
-                        <td><span class="${statusClass} fw-bold">${statusDisplay}</span></td>
-                        <td>${task.created_at}</td>
-                        <td>
-                            <a href="/task/${task.task_id}" class="btn btn-sm btn-primary me-1" title="View Task Details">
-                                <i class="fas fa-eye"></i>
-                            </a>
-                            ${task.status === 'completed' ? `
-                                <a href="${task.subtitle_gofile_link}" target="_blank" class="btn btn-sm btn-success" title="Download Subtitles">
-                                    <i class="fas fa-download me-1"></i>Download
-                                </a>
-                            ` : ''}
-                        </td>
-                    </tr>
-                `;
-            }
-            
-            html += `
+                        <tbody id="tasksTableBody">
+                            ${tasks.map(renderTaskRow).join('')}
                         </tbody>
                     </table>
                 </div>
+                <div id="loadMoreContainer" class="text-center mt-3"></div>
             `;
-            
-            tasksListContainer.innerHTML = html;
+            renderLoadMore();
         };
         
         // Load tasks
@@ -0,0 +1,185 @@
+import os
+import re
+import uuid
+import shutil
+import logging
+from werkzeug.utils import secure_filename
+from config import Config
+from downloader import DownloadStats, download, iter_download
+from gofile_api import open_upload, upload_to_gofile, upload_many_to_gofile
+
+# Configure logging
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+
+def copy_file(source_path, destination_path):
+    """
+    Copy a file without moving its data through Python.
+
+    Tries a hard link first (no data copied at all), then os.sendfile
+    (copied inside the kernel), then a plain buffered copy.
+    """
+    try:
+        os.link(source_path, destination_path)
+        return
+    except OSError:
+        pass
+
+    with open(source_path, 'rb') as source, open(destination_path, 'wb') as destination:
+        size = os.fstat(source.fileno()).st_size
+        offset = 0
+        try:
+            while offset < size:
+                sent = os.sendfile(destination.fileno(), source.fileno(), offset, size - offset)
+                if sent == 0:
+                    break
+                offset += sent
+        except (OSError, AttributeError):
+            # sendfile to a regular file is not supported everywhere
+            source.seek(offset)
+            destination.seek(offset)
+            shutil.copyfileobj(source, destination, Config.DOWNLOAD_CHUNK_SIZE)
+
+
+class StorageBackend:
+    """
+    Where task inputs come from and subtitle files go to.
+
+    Uploads return dictionaries with 'fileId', 'fileName' and 'downloadPage'
+    (the link stored on the task), as the Gofile client does.
+    """
+
+    name = None
+
+    def upload(self, file, filename=None):
+        """Store a file (path, bytes or binary stream) and return its upload result."""
+        raise NotImplementedError
+
+    def upload_many(self, files):
+        """Store several (file, filename) pairs and return their upload results in order."""
+        return [self.upload(file, filename) for file, filename in files]
+
+    def local_path(self, link):
+        """Return a filesystem path for `link` if this backend can read it directly, else None."""
+        return None
+
+    def download(self, link, path):
+        """Fetch `link` to `path` and return DownloadStats."""
+        return download(link, path)
+
+    def iter_download(self, link, stats=None):
+        """Yield the content of `link` in chunks."""
+        return iter_download(link, stats=stats)
+
+
+class GofileStorage(StorageBackend):
+    """
+    Storage on Gofile, over its HTTP API.
+
+    Uploads go through the synchronous client in gofile_api, or through the
+    asyncio client in gofile_async when `client` is 'async'.
+    """
+
+    name = 'gofile'
+
+    def __init__(self, client='sync'):
+        if client == 'async':
+            import gofile_async
+            self._upload, self._upload_many = gofile_async.upload_to_gofile, gofile_async.upload_many_to_gofile
+        elif client == 'sync':
+            self._upload, self._upload_many = upload_to_gofile, upload_many_to_gofile
+        else:
+            raise ValueError(f"Unknown Gofile client: {client}")
+        self.client = client
+
+    def upload(self, file, filename=None):
+        return self._upload(file, filename)
+
+    def upload_many(self, files):
+        return self._upload_many(files)
+
+
+class LocalStorage(StorageBackend):
+    """
+    Storage on a local or shared filesystem.
+
+    Files live in `<root>/<fileId>/<filename>` and are served by the web app
+    at `<base_url>/files/<fileId>/<filename>`. Workers that see the same
+    volume read and write them directly, with no network calls.
+    """
+
+    name = 'local'
+    LINK_PATTERN = re.compile(r'/files/([0-9a-f]{32})/([^/]+)$')
+
+    def __init__(self, root, base_url=''):
+        self.root = root
+        self.base_url = base_url.rstrip('/')
+
+    def path_for(self, file_id, filename):
+        """Return the path of a stored file, or None if the name is not valid."""
+        if not re.fullmatch(r'[0-9a-f]{32}', file_id) or secure_filename(filename) != filename:
+            return None
+        return os.path.join(self.root, file_id, filename)
+
+    def upload(self, file, filename=None):
+        if isinstance(file, (str, os.PathLike)):
+            if not os.path.exists(file):
+                raise ValueError(f"File not found: {file}")
+            filename = filename or os.path.basename(file)
+        elif not filename:
+            raise ValueError("A filename is required when uploading from memory")
+
+        file_id = uuid.uuid4().hex
+        filename = secure_filename(filename) or 'file'
+        directory = os.path.join(self.root, file_id)
+        os.makedirs(directory, exist_ok=True)
+        destination = os.path.join(directory, filename)
+
+        if isinstance(file, (str, os.PathLike)):
+            copy_file(file, destination)
+        else:
+            with open_upload(file) as source, open(destination, 'wb') as f:
+                shutil.copyfileobj(source, f, Config.DOWNLOAD_CHUNK_SIZE)
+
+        logger.info(f"Stored {filename} in local storage as {file_id}")
+        return {
+            'fileId': file_id,
+            'fileName': filename,
+            'downloadPage': f"{self.base_url}/files/{file_id}/{filename}"
+        }
+
+    def local_path(self, link):
+        match = self.LINK_PATTERN.search(link or '')
+        if not match or not link.startswith(f"{self.base_url}/files/"):
+            return None
+        path = self.path_for(*match.groups())
+        return path if path and os.path.exists(path) else None
+
+    def download(self, link, path):
+        source_path = self.local_path(link)
+        if source_path is None:
+            return super().download(link, path)
+        stats = DownloadStats()
+        if os.path.exists(path):
+            # A hard link needs the destination name to be free
+            os.remove(path)
+        copy_file(source_path, path)
+        stats.add(os.path.getsize(path))
+        return stats.finish()
+
+
+_storage = None
+
+
+def get_storage():
+    """Return the storage backend selected by Config.STORAGE_BACKEND."""
+    global _storage
+    if _storage is None:
+        if Config.STORAGE_BACKEND == 'local':
+            _storage = LocalStorage(Config.LOCAL_STORAGE_ROOT, Config.LOCAL_STORAGE_BASE_URL)
+        elif Config.STORAGE_BACKEND == 'gofile':
+            _storage = GofileStorage(Config.GOFILE_CLIENT)
+        else:
+            raise ValueError(f"Unknown storage backend: {Config.STORAGE_BACKEND}")
+    return _storage
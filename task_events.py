@@ -0,0 +1,156 @@
+import json
+import time
+import logging
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from config import Config
+
+# Configure logging
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+CHANNEL_PREFIX = 'task-events:'
+SNAPSHOT_PREFIX = 'task-snapshot:'
+TERMINAL_STATUSES = {'completed', 'failed'}
+
+_redis = None
+
+
+def get_redis():
+    """Return the Redis client used for task events."""
+    global _redis
+    if _redis is None:
+        import redis
+        _redis = redis.Redis.from_url(Config.TASK_EVENTS_REDIS_URL)
+    return _redis
+
+
+def publish(snapshot):
+    """
+    Publish a task snapshot to its subscribers.
+
+    `snapshot` is SubtitleTask.to_dict(), or just the fields that changed
+    (with task_id). Snapshots are merged into the task's state kept in Redis
+    for TASK_EVENTS_SNAPSHOT_TTL seconds, so a new subscriber gets the
+    current state without a database query.
+    """
+    task_id = snapshot['task_id']
+    try:
+        pipeline = get_redis().pipeline()
+        pipeline.hset(SNAPSHOT_PREFIX + task_id, mapping={key: json.dumps(value) for key, value in snapshot.items()})
+        pipeline.expire(SNAPSHOT_PREFIX + task_id, Config.TASK_EVENTS_SNAPSHOT_TTL)
+        pipeline.publish(CHANNEL_PREFIX + task_id, json.dumps(snapshot))
+        pipeline.execute()
+    except Exception as e:
+        logger.warning(f"Error publishing event for task {task_id}: {str(e)}")
+
+
+def get_snapshot(task_id):
+    """Return the merged state of a task, or None unless a full snapshot was published."""
+    fields = get_redis().hgetall(SNAPSHOT_PREFIX + task_id)
+    snapshot = {key.decode('utf-8'): json.loads(value) for key, value in fields.items()}
+    # Only partial updates were published: the state is incomplete
+    return snapshot if 'id' in snapshot else None
+
+
+def subscribe(task_id):
+    """Subscribe to the events of a task; returns the Redis PubSub object."""
+    pubsub = get_redis().pubsub(ignore_subscribe_messages=True)
+    pubsub.subscribe(CHANNEL_PREFIX + task_id)
+    return pubsub
+
+
+def iter_events(pubsub, heartbeat=None, max_seconds=None):
+    """
+    Yield task snapshots from a subscription, or None after `heartbeat` idle seconds.
+
+    Stops after a snapshot with a terminal status, or after `max_seconds`.
+    The subscription is closed when the generator ends.
+    """
+    heartbeat = heartbeat or Config.TASK_EVENTS_HEARTBEAT
+    deadline = time.monotonic() + (max_seconds or Config.TASK_EVENTS_MAX_SECONDS)
+    try:
+        while time.monotonic() < deadline:
+            message = pubsub.get_message(timeout=min(heartbeat, max(deadline - time.monotonic(), 0)))
+            if message is None:
+                yield None
+                continue
+            snapshot = json.loads(message['data'])
+            yield snapshot
+            if snapshot.get('status') in TERMINAL_STATUSES:
+                return
+    finally:
+        pubsub.close()
+
+
+def format_sse(snapshot):
+    """Format a snapshot as a Server-Sent Events message, or a keep-alive comment for None."""
+    if snapshot is None:
+        return ': keep-alive\n\n'
+    return f"data: {json.dumps(snapshot)}\n\n"
+
+
+# to_dict fields derived from other columns, refreshed whenever one of those changes
+DERIVED_FIELDS = {
+    'format_type': ('formats',),
+    'download_bytes': ('download_throughput',),
+    'download_seconds': ('download_throughput',),
+    'segment_count': ('available_formats',),
+}
+
+
+def changed_fields(instance):
+    """
+    Return the part of instance.to_dict() that the last flush changed.
+
+    A task object can be loaded long before it is flushed (the worker holds
+    one across the whole transcription), so its unchanged attributes may be
+    older than what task_state has committed since. Only the columns in the
+    flush's attribute history are reported, plus task_id and updated_at.
+    New rows are reported in full.
+    """
+    state = inspect(instance)
+    snapshot = instance.to_dict()
+    if state.pending or not state.has_identity:
+        return snapshot
+    fields = set()
+    for attr in state.attrs:
+        if attr.key != 'updated_at' and attr.history.has_changes():
+            fields.add(attr.key)
+            fields.update(DERIVED_FIELDS.get(attr.key, ()))
+    fields &= snapshot.keys()
+    if not fields:
+        return None
+    fields.update(('task_id', 'updated_at'))
+    return {key: snapshot[key] for key in fields}
+
+
+def publish_task_commits():
+    """
+    Publish the changes to every SubtitleTask made by a committed transaction.
+
+    Changes are collected at flush time, while the attribute history is
+    available, and only published once the transaction commits. The listeners
+    hook every SQLAlchemy session in the process, so this is only called by
+    the worker (from its worker_init handler), whose stage transitions are
+    what subscribers wait for; the web process never registers them.
+    """
+    from models import SubtitleTask
+
+    @event.listens_for(Session, 'after_flush')
+    def collect_task_snapshots(session, flush_context):
+        snapshots = session.info.setdefault('task_snapshots', {})
+        for instance in list(session.new) + list(session.dirty):
+            if isinstance(instance, SubtitleTask) and instance.task_id:
+                changes = changed_fields(instance)
+                if changes:
+                    snapshots.setdefault(instance.task_id, {}).update(changes)
+
+    @event.listens_for(Session, 'after_commit')
+    def publish_task_snapshots(session):
+        for snapshot in session.info.pop('task_snapshots', {}).values():
+            publish(snapshot)
+
+    @event.listens_for(Session, 'after_rollback')
+    def drop_task_snapshots(session):
+        session.info.pop('task_snapshots', None)
@@ -0,0 +1,145 @@
+import json
+import time
+import logging
+import datetime
+import threading
+from sqlalchemy import update
+from config import Config
+from database import get_engine
+from models import SubtitleTask
+
+# Configure logging
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+# Statuses each transition may start from. A transition is one
+# UPDATE ... WHERE task_id = ? AND status IN (...), so it never needs the row
+# loaded first, and of two racing writers only the first one applies: a
+# task that completed is never failed afterwards, and the other way round.
+TRANSITIONS = {
+    'start': ('pending',),
+    'progress': ('pending',),
+    'retry': ('pending',),
+    'complete': ('pending',),
+    'fail': ('pending',),
+}
+
+_stats = {name: {'applied': 0, 'rejected': 0, 'coalesced': 0, 'seconds': 0.0, 'max_seconds': 0.0}
+          for name in TRANSITIONS}
+_last_progress = {}
+_lock = threading.Lock()
+
+
+def _transition(name, task_id, published=None, **values):
+    """
+    Apply a guarded transition; returns True if the task was in an expected status.
+
+    The UPDATE runs in a transaction of its own, on its own connection, so
+    it neither commits nor expires whatever the caller's session holds.
+    Applied transitions are published to the task's event stream, with the
+    fields in `published` in place of their column values.
+    """
+    values['updated_at'] = datetime.datetime.utcnow()
+    statement = (
+        update(SubtitleTask)
+        .where(SubtitleTask.task_id == task_id, SubtitleTask.status.in_(TRANSITIONS[name]))
+        .values(**values)
+    )
+    started = time.perf_counter()
+    with get_engine().begin() as connection:
+        applied = connection.execute(statement).rowcount == 1
+    elapsed = time.perf_counter() - started
+
+    with _lock:
+        stats = _stats[name]
+        stats['applied' if applied else 'rejected'] += 1
+        stats['seconds'] += elapsed
+        stats['max_seconds'] = max(stats['max_seconds'], elapsed)
+
+    if not applied:
+        logger.debug(f"Transition {name} of task {task_id} rejected: status not in {TRANSITIONS[name]}")
+    elif Config.TASK_EVENTS_ENABLED:
+        from task_events import publish
+        event = {key: value for key, value in values.items() if key != 'updated_at'}
+        if event.get('completed_at'):
+            event['completed_at'] = event['completed_at'].strftime('%Y-%m-%d %H:%M:%S')
+        event.update(published or {})
+        publish(dict(event, task_id=task_id, updated_at=values['updated_at'].isoformat()))
+    return applied
+
+
+def start(task_id):
+    """A worker picked the task up."""
+    _forget(task_id)
+    return _transition('start', task_id, celery_status='STARTED', progress='Task started')
+
+
+def progress(task_id, celery_status, message, force=False):
+    """
+    Record progress of a running task.
+
+    Writes are coalesced: a message identical to the last one written is
+    dropped, and so is a new message with the same celery_status within
+    TASK_PROGRESS_MIN_INTERVAL seconds of the last write, unless `force`.
+    """
+    now = time.monotonic()
+    with _lock:
+        last = _last_progress.get(task_id)
+        duplicate = last is not None and last[:2] == (celery_status, message)
+        too_soon = (not force and last is not None and last[0] == celery_status
+                    and now - last[2] < Config.TASK_PROGRESS_MIN_INTERVAL)
+        if duplicate or too_soon:
+            _stats['progress']['coalesced'] += 1
+            return False
+        if len(_last_progress) > 10000:
+            _last_progress.clear()
+        _last_progress[task_id] = (celery_status, message, now)
+    return _transition('progress', task_id, celery_status=celery_status, progress=message)
+
+
+def retry(task_id, message):
+    """The task hit a transient error and will run again later."""
+    _forget(task_id)
+    return _transition('retry', task_id, celery_status='RETRY', progress=message)
+
+
+def complete(task_id, outputs=None, **results):
+    """
+    The subtitles are uploaded.
+
+    `outputs` are the uploaded files by format (see SubtitleTask.set_outputs)
+    and `results` other columns to set along, such as subtitle_gofile_link.
+    """
+    _forget(task_id)
+    if outputs is not None:
+        results['subtitle_outputs'] = json.dumps(outputs)
+    return _transition('complete', task_id, published={'subtitle_outputs': outputs} if outputs is not None else None,
+                       status='completed', celery_status='SUCCESS', progress='Subtitles generated successfully',
+                       completed_at=datetime.datetime.utcnow(), **results)
+
+
+def fail(task_id, error):
+    """The task failed for good."""
+    _forget(task_id)
+    return _transition('fail', task_id, status='failed', celery_status='FAILURE',
+                       message=str(error), progress=f"Error: {str(error)}")
+
+
+def stats():
+    """Return per-transition counters and UPDATE latency of this process."""
+    with _lock:
+        return {
+            name: dict(
+                counters,
+                seconds=round(counters['seconds'], 6),
+                max_seconds=round(counters['max_seconds'], 6),
+                avg_seconds=round(counters['seconds'] / (counters['applied'] + counters['rejected']), 6)
+                if counters['applied'] + counters['rejected'] else 0.0
+            )
+            for name, counters in _stats.items()
+        }
+
+
+def _forget(task_id):
+    with _lock:
+        _last_progress.pop(task_id, None)
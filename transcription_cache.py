@@ -0,0 +1,222 @@
+import os
+import gzip
+import json
+import hashlib
+import logging
+import tempfile
+import threading
+import numpy as np
+from config import Config
+
+# Configure logging
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+REDIS_KEY_PREFIX = 'transcription:'
+REDIS_STATS_KEY = 'transcription_cache:stats'
+
+
+class TranscriptionCache:
+    """
+    Content-addressed cache of transcription results.
+
+    Entries are keyed by a hash of the decoded audio and the transcription
+    parameters, and hold the segment list. They are stored gzipped on local
+    disk, bounded to `max_bytes` with least-recently-used eviction (file
+    mtime is bumped on every hit), and optionally shared with other workers
+    through Redis.
+
+    Lookups happen in the workers but are reported by the web app, so the
+    counters are kept in Redis at `stats_redis_url`, which defaults to
+    `redis_url`.
+    """
+
+    def __init__(self, directory, max_bytes, redis_url=None, redis_ttl=None, stats_redis_url=None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.redis_ttl = redis_ttl
+        self._redis_url = redis_url
+        self._redis = None
+        self._stats_redis_url = stats_redis_url or redis_url
+        self._stats_redis = None
+        self._size = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(audio, **parameters):
+        """Return the cache key for decoded audio and transcription parameters."""
+        digest = hashlib.sha256()
+        digest.update(memoryview(np.ascontiguousarray(audio)).cast('B'))
+        digest.update(json.dumps(parameters, sort_keys=True).encode('utf-8'))
+        return digest.hexdigest()
+
+    def get(self, key, audio_bytes=0):
+        """Return the cached transcription for `key`, or None on a miss."""
+        payload = self._read_local(key)
+        if payload is None:
+            payload = self._read_redis(key)
+            if payload is not None:
+                self._write_local(key, payload)
+
+        if payload is None:
+            self._count(misses=1)
+            return None
+
+        transcription = json.loads(gzip.decompress(payload).decode('utf-8'))
+        self._count(hits=1, bytes_saved=audio_bytes,
+                    audio_seconds_saved=transcription.get('audio_seconds') or 0.0)
+        return transcription
+
+    def put(self, key, transcription):
+        """Store the segments (and language and audio statistics) of a transcription."""
+        entry = {
+            'segments': [
+                {'start': segment['start'], 'end': segment['end'], 'text': segment['text']}
+                for segment in transcription['segments']
+            ],
+            'language': transcription.get('language'),
+            'audio_seconds': transcription.get('audio_seconds'),
+            'skipped_seconds': transcription.get('skipped_seconds'),
+        }
+        payload = gzip.compress(json.dumps(entry, separators=(',', ':')).encode('utf-8'))
+        self._write_local(key, payload)
+
+        client = self._get_redis()
+        if client is not None:
+            try:
+                client.set(REDIS_KEY_PREFIX + key, payload, ex=self.redis_ttl or None)
+            except Exception as e:
+                logger.warning(f"Error writing transcription cache entry to Redis: {str(e)}")
+
+    def stats(self):
+        """Return the counters of every process using the cache, or None when they are not available."""
+        client = self._get_stats_redis()
+        if client is None:
+            return None
+        try:
+            shared = {key.decode(): float(value) for key, value in client.hgetall(REDIS_STATS_KEY).items()}
+        except Exception as e:
+            logger.warning(f"Error reading transcription cache stats from Redis: {str(e)}")
+            return None
+
+        lookups = shared.get('hits', 0) + shared.get('misses', 0)
+        return {
+            'hits': int(shared.get('hits', 0)),
+            'misses': int(shared.get('misses', 0)),
+            'hit_rate': shared.get('hits', 0) / lookups if lookups else 0.0,
+            'bytes_saved': int(shared.get('bytes_saved', 0)),
+            'audio_seconds_saved': round(shared.get('audio_seconds_saved', 0.0), 3),
+        }
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.json.gz")
+
+    def _read_local(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                payload = f.read()
+            os.utime(path)
+            return payload
+        except OSError:
+            return None
+
+    def _write_local(self, key, payload):
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(payload)
+            os.replace(temp_path, path)
+        except OSError as e:
+            logger.warning(f"Error writing transcription cache entry: {str(e)}")
+            return
+
+        with self._lock:
+            if self._size is not None:
+                self._size += len(payload)
+            if self._size is None or self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """Delete the least recently used entries until the cache fits in max_bytes."""
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith('.json.gz'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+        size = sum(entry[1] for entry in entries)
+        for _, entry_size, path in sorted(entries):
+            if size <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                size -= entry_size
+            except OSError:
+                pass
+        self._size = size
+
+    def _read_redis(self, key):
+        client = self._get_redis()
+        if client is None:
+            return None
+        try:
+            return client.get(REDIS_KEY_PREFIX + key)
+        except Exception as e:
+            logger.warning(f"Error reading transcription cache entry from Redis: {str(e)}")
+            return None
+
+    def _get_redis(self):
+        if not self._redis_url:
+            return None
+        if self._redis is None:
+            import redis
+            self._redis = redis.Redis.from_url(self._redis_url)
+        return self._redis
+
+    def _get_stats_redis(self):
+        if not self._stats_redis_url:
+            return None
+        if self._stats_redis is None:
+            import redis
+            self._stats_redis = redis.Redis.from_url(self._stats_redis_url, socket_connect_timeout=1,
+                                                     socket_timeout=1)
+        return self._stats_redis
+
+    def _count(self, **counters):
+        client = self._get_stats_redis()
+        if client is not None:
+            try:
+                pipeline = client.pipeline()
+                for name, value in counters.items():
+                    pipeline.hincrbyfloat(REDIS_STATS_KEY, name, value)
+                pipeline.execute()
+            except Exception as e:
+                logger.warning(f"Error updating transcription cache stats in Redis: {str(e)}")
+
+
+_cache = None
+
+
+def get_cache():
+    """Return the process-wide transcription cache, or None if it is disabled."""
+    global _cache
+    if not Config.TRANSCRIPTION_CACHE_ENABLED:
+        return None
+    if _cache is None:
+        _cache = TranscriptionCache(
+            Config.TRANSCRIPTION_CACHE_DIR,
+            Config.TRANSCRIPTION_CACHE_MAX_MB * 1024 * 1024,
+            redis_url=Config.TRANSCRIPTION_CACHE_REDIS_URL or None,
+            redis_ttl=Config.TRANSCRIPTION_CACHE_REDIS_TTL,
+            stats_redis_url=Config.TRANSCRIPTION_CACHE_STATS_REDIS_URL or None
+        )
+    return _cache
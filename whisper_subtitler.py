@@ -1,10 +1,14 @@
+import io
 import os
-import tempfile
+import json
 import logging
-import whisper
+import threading
 import subprocess
-import shutil
-from pathlib import Path
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from config import Config
+from model_registry import get_model, get_registry
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
@@ -22,171 +26,739 @@ def is_ffmpeg_available():
 # Global variable to track ffmpeg availability
 FFMPEG_AVAILABLE = is_ffmpeg_available()
 
-def extract_audio(video_path):
-    """Extract audio from video file using ffmpeg."""
+# Whisper models expect 16 kHz mono audio
+SAMPLE_RATE = 16000
+
+def probe_duration(file_path):
+    """Return the duration of a media file in seconds, or None if unknown."""
+    try:
+        result = subprocess.run(
+            ['ffprobe', '-v', 'error', '-show_entries', 'format=duration',
+             '-of', 'default=noprint_wrappers=1:nokey=1', file_path],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+        return float(result.stdout.decode('utf-8').strip())
+    except (subprocess.SubprocessError, FileNotFoundError, ValueError):
+        return None
+
+def read_pcm_stream(stream, expected_samples=None):
+    """
+    Read 16-bit little-endian mono PCM from a binary stream into float32 samples.
+
+    The samples are read straight into a preallocated buffer sized from
+    `expected_samples` (grown if the estimate turns out to be short), so the
+    decoded audio is never held as intermediate bytes objects.
+    """
+    capacity = max(int(expected_samples or 0), SAMPLE_RATE * 60)
+    buffer = np.empty(capacity, dtype='<i2')
+    filled = 0  # bytes
+
+    while True:
+        if filled == buffer.nbytes:
+            grown = np.empty(buffer.size * 2, dtype='<i2')
+            grown[:buffer.size] = buffer
+            buffer = grown
+        view = memoryview(buffer).cast('B')[filled:]
+        count = stream.readinto(view)
+        if not count:
+            break
+        filled += count
+
+    audio = buffer[:filled // 2].astype(np.float32)
+    audio *= 1.0 / 32768.0
+    return audio
+
+def run_ffmpeg_decode(source, expected_samples=None, feed=None):
+    """
+    Run ffmpeg to decode `source` to 16 kHz mono PCM and read it into float32 samples.
+
+    Args:
+        source: ffmpeg input ('pipe:0' to read from stdin)
+        expected_samples: Estimated sample count, used to preallocate the buffer
+        feed: Iterable of byte chunks written to ffmpeg's stdin from a
+            background thread while the decoded audio is read
+    """
+    cmd = [
+        'ffmpeg', '-threads', '0', '-i', source,
+        '-vn', '-sn', '-dn',
+        '-f', 's16le', '-acodec', 'pcm_s16le', '-ac', '1', '-ar', str(SAMPLE_RATE),
+        '-loglevel', 'error', '-'
+    ]
+    if feed is None:
+        cmd.insert(1, '-nostdin')
+    process = subprocess.Popen(
+        cmd,
+        stdin=subprocess.PIPE if feed is not None else subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE
+    )
+
+    # Drain stderr in the background so a chatty ffmpeg cannot block on a full pipe
+    stderr_chunks = []
+    stderr_reader = threading.Thread(target=lambda: stderr_chunks.append(process.stderr.read()), daemon=True)
+    stderr_reader.start()
+
+    # Feed stdin from another thread so input and decoded output flow at the same time
+    feed_errors = []
+    feeder = None
+    if feed is not None:
+        def write_feed():
+            try:
+                for chunk in feed:
+                    if chunk:
+                        process.stdin.write(chunk)
+            except BrokenPipeError:
+                # ffmpeg stopped reading; its exit status reports why
+                pass
+            except Exception as e:
+                feed_errors.append(e)
+                process.kill()
+            finally:
+                try:
+                    process.stdin.close()
+                except BrokenPipeError:
+                    pass
+
+        feeder = threading.Thread(target=write_feed, daemon=True)
+        feeder.start()
+
+    try:
+        audio = read_pcm_stream(process.stdout, expected_samples)
+    except Exception:
+        process.kill()
+        raise
+    finally:
+        process.stdout.close()
+        returncode = process.wait()
+        stderr_reader.join()
+        if feeder is not None:
+            feeder.join()
+
+    if feed_errors:
+        raise feed_errors[0]
+
+    if returncode != 0:
+        error_message = b''.join(stderr_chunks).decode('utf-8', errors='replace')
+        logger.error(f"Error decoding audio: {error_message}")
+        raise RuntimeError(f"Failed to decode audio: {error_message}")
+
+    return audio
+
+def decode_audio(file_path):
+    """
+    Decode the audio stream of a media file to 16 kHz mono float32 samples.
+
+    ffmpeg decodes only the audio stream and writes raw PCM to a pipe, so
+    video frames, subtitles and data streams are skipped and nothing is
+    written to disk. The result can be passed directly to the model.
+    """
+    if not FFMPEG_AVAILABLE:
+        raise RuntimeError("ffmpeg is required for audio decoding but not found on the system.")
+
+    duration = probe_duration(file_path)
+    expected_samples = int(duration * SAMPLE_RATE) + SAMPLE_RATE if duration else None
+
+    audio = run_ffmpeg_decode(file_path, expected_samples)
+    logger.info(f"Decoded {len(audio) / SAMPLE_RATE:.1f}s of audio from {file_path}")
+    return audio
+
+def decode_audio_stream(chunks):
+    """
+    Decode media arriving as an iterable of byte chunks (e.g. an HTTP body).
+
+    The chunks are piped into ffmpeg's stdin while the decoded audio is read
+    from its stdout, so decoding starts with the first bytes and the input is
+    never written to disk. Containers that need seeking (such as MP4 files
+    with the index at the end) cannot be decoded this way and raise
+    RuntimeError.
+    """
     if not FFMPEG_AVAILABLE:
-        raise RuntimeError("ffmpeg is required for audio extraction but not found on the system.")
+        raise RuntimeError("ffmpeg is required for audio decoding but not found on the system.")
+
+    audio = run_ffmpeg_decode('pipe:0', feed=chunks)
+    logger.info(f"Decoded {len(audio) / SAMPLE_RATE:.1f}s of audio from stream")
+    return audio
+
+def build_transcription_options(language='auto', output_language=None):
+    """Build the keyword arguments for model.transcribe."""
+    transcription_options = {}
     
-    # Create temporary file for audio
-    audio_path = tempfile.mktemp(suffix='.wav')
+    # Only set language if not auto
+    if language != 'auto':
+        transcription_options['language'] = language
     
-    try:
-        # Run ffmpeg to extract audio
-        cmd = ['ffmpeg', '-i', video_path, '-q:a', '0', '-map', 'a', audio_path]
-        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        
-        if result.returncode != 0:
-            error_message = result.stderr.decode('utf-8', errors='replace')
-            raise RuntimeError(f"Failed to extract audio: {error_message}")
-        
-        return audio_path
-    except Exception as e:
-        # Clean up temporary file if extraction fails
-        if os.path.exists(audio_path):
-            os.remove(audio_path)
-        logger.error(f"Error extracting audio: {str(e)}")
-        raise
+    # Set task to translate if output language is specified and different from source
+    if output_language and output_language != 'same' and output_language != language:
+        transcription_options['task'] = 'translate'
+        transcription_options['language'] = language  # Source language
+        transcription_options['target_language'] = output_language  # Target language
+        logger.info(f"Translating from {language if language != 'auto' else 'auto-detected'} to {output_language}")
+    
+    return transcription_options
 
-def transcribe_audio(audio_path, language='auto', model_name='base', output_language=None):
+def transcribe_audio(audio, language='auto', model_name='base', output_language=None):
     """
     Transcribe audio using Whisper model with optional translation to another language.
     
     Args:
-        audio_path: Path to audio file
+        audio: 16 kHz mono float32 samples from decode_audio (or a path to an audio file)
         language: Source language code or 'auto' for auto-detection
         model_name: Whisper model size ('tiny', 'base', 'small', 'medium', 'large')
         output_language: Language code to translate to (None or 'same' means no translation)
     """
     try:
-        # Load Whisper model
-        logger.info(f"Loading Whisper model: {model_name}")
-        model = whisper.load_model(model_name)
+        # Get Whisper model (cached across tasks by the model registry)
+        model = get_model(model_name)
         
         # Transcribe
         logger.info("Starting transcription...")
-        transcription_options = {}
-        
-        # Only set language if not auto
-        if language != 'auto':
-            transcription_options['language'] = language
+        transcription_options = build_transcription_options(language, output_language)
         
-        # Set task to translate if output language is specified and different from source
-        if output_language and output_language != 'same' and output_language != language:
-            transcription_options['task'] = 'translate'
-            transcription_options['language'] = language  # Source language
-            transcription_options['target_language'] = output_language  # Target language
-            logger.info(f"Translating from {language if language != 'auto' else 'auto-detected'} to {output_language}")
-        
-        result = model.transcribe(audio_path, **transcription_options)
+        result = model.transcribe(audio, **transcription_options)
         
         return result
     except Exception as e:
         logger.error(f"Error in transcription: {str(e)}")
         raise
 
-def format_subtitles(transcription, format_type='srt'):
-    """Format transcription results to the specified subtitle format."""
-    segments = transcription['segments']
+def frame_energy(audio, frame_size):
+    """Return the RMS energy of consecutive `frame_size`-sample frames."""
+    frame_count = len(audio) // frame_size
+    frames = audio[:frame_count * frame_size].reshape(frame_count, frame_size)
+    return np.sqrt(np.mean(np.square(frames, dtype=np.float32), axis=1))
+
+def find_split_points(audio, min_seconds=30, max_seconds=120, frame_seconds=0.1):
+    """
+    Choose chunk boundaries (in samples) at the quietest points of the audio.
+
+    Each chunk is between `min_seconds` and `max_seconds` long (except the
+    last one, which may be shorter). Within that window the boundary is put
+    in the frame with the lowest energy, smoothed over half a second so that
+    pauses win over single quiet frames. Returns the boundaries including 0
+    and len(audio).
+    """
+    frame_size = int(frame_seconds * SAMPLE_RATE)
+    min_frames = int(min_seconds / frame_seconds)
+    max_frames = int(max_seconds / frame_seconds)
+
+    energy = frame_energy(audio, frame_size)
+    smoothing = max(1, int(0.5 / frame_seconds))
+    energy = np.convolve(energy, np.ones(smoothing) / smoothing, mode='same')
+
+    boundaries = [0]
+    start = 0
+    while len(energy) - start > max_frames:
+        window = energy[start + min_frames:start + max_frames]
+        start = start + min_frames + int(np.argmin(window))
+        boundaries.append(start * frame_size)
+    boundaries.append(len(audio))
+    return boundaries
+
+def split_audio(audio, min_seconds=30, max_seconds=120):
+    """Split audio at low-energy points. Returns (offset_seconds, samples) pairs."""
+    boundaries = find_split_points(audio, min_seconds, max_seconds)
+    return [
+        (start / SAMPLE_RATE, audio[start:end])
+        for start, end in zip(boundaries[:-1], boundaries[1:])
+        if end > start
+    ]
+
+def stitch_segments(chunk_results):
+    """
+    Merge per-chunk segments into one list on the original timeline.
+
+    Args:
+        chunk_results: (offset_seconds, duration_seconds, segments) per chunk, in order
+
+    Segment times are shifted by the chunk offset and clamped to the chunk, and
+    a segment that repeats the text of the previous one across a boundary is
+    dropped.
+    """
+    stitched = []
+    for offset, duration, segments in chunk_results:
+        for segment in segments:
+            start = segment['start']
+            if start >= duration:
+                # Whisper sometimes emits a segment past the end of the audio it was given
+                continue
+            start = offset + start
+            end = offset + min(segment['end'], duration)
+            text = segment['text']
+
+            if stitched:
+                previous = stitched[-1]
+                if text.strip() == previous['text'].strip() and start <= previous['end'] + 1.0:
+                    previous['end'] = max(previous['end'], end)
+                    continue
+                start = max(start, previous['end'])
+
+            stitched.append({'id': len(stitched), 'start': start, 'end': max(start, end), 'text': text})
+    return stitched
+
+# Chunk pools by (model name, workers): {'pool', 'users', 'timer'}
+_chunk_pools = {}
+_chunk_pool_lock = threading.Lock()
+
+# Approximate resident size of a process holding each Whisper model (fp32
+# weights plus the torch runtime), used when the model is not loaded here
+CHUNK_WORKER_MEMORY_MB = {'tiny': 500, 'base': 650, 'small': 1300, 'medium': 3400, 'large': 6600}
+# Resident size of a chunk pool process besides the model weights
+CHUNK_WORKER_OVERHEAD_MB = 350
+
+def _init_chunk_worker(model_name, num_threads):
+    """Initializer for chunk pool processes: load the model once per process."""
+    try:
+        import torch
+        torch.set_num_threads(num_threads)
+    except ImportError:
+        pass
+    get_model(model_name)
+
+def detect_language(audio, model_name='base'):
+    """Detect the spoken language from the first 30 seconds of audio."""
+    import whisper
+    model = get_model(model_name)
+    audio = whisper.pad_or_trim(audio)
+    mel = whisper.log_mel_spectrogram(audio, getattr(model.dims, 'n_mels', 80)).to(model.device)
+    _, probabilities = model.detect_language(mel)
+    return max(probabilities, key=probabilities.get)
+
+def _transcribe_chunk_in_worker(model_name, audio, transcription_options):
+    """Transcribe one chunk in a pool process. Returns its segments and language."""
+    result = get_model(model_name).transcribe(audio, **transcription_options)
+    segments = [
+        {'start': segment['start'], 'end': segment['end'], 'text': segment['text']}
+        for segment in result['segments']
+    ]
+    return {'segments': segments, 'language': result.get('language')}
+
+def chunk_pool_size(model_name):
+    """
+    Return how many chunk pool processes fit in WHISPER_CHUNK_MEMORY_BUDGET_MB.
+
+    Every process loads its own copy of the model, so the pool is sized by
+    memory rather than by cores (and never above the number of cores).
+    WHISPER_CHUNK_WORKERS overrides the computed size.
+    """
+    if Config.WHISPER_CHUNK_WORKERS:
+        return Config.WHISPER_CHUNK_WORKERS
+    model_bytes = get_registry().model_bytes(model_name)
+    if model_bytes is not None:
+        process_mb = model_bytes / (1024 * 1024) + CHUNK_WORKER_OVERHEAD_MB
+    else:
+        process_mb = CHUNK_WORKER_MEMORY_MB.get(model_name, max(CHUNK_WORKER_MEMORY_MB.values()))
+    return max(1, min(os.cpu_count() or 1, int(Config.WHISPER_CHUNK_MEMORY_BUDGET_MB // process_mb)))
+
+def in_daemonic_process():
+    """Return True in a daemonic process (such as a Celery prefork pool child), which cannot start children."""
+    if multiprocessing.current_process().daemon:
+        return True
+    try:
+        import billiard
+    except ImportError:
+        return False
+    return bool(billiard.current_process().daemon)
+
+def get_chunk_pool(model_name, workers):
+    """
+    Return the process pool for chunk transcription, keeping it warm across calls.
+
+    There is one pool per model and size, each counting its users. Callers
+    must release it with release_chunk_pool(); a pool shuts down after
+    WHISPER_CHUNK_POOL_IDLE_SECONDS without users, or as soon as a pool for
+    another model is started while it is unused.
+    """
+    if in_daemonic_process():
+        raise RuntimeError(
+            "Long-media mode starts a local process pool, which a daemonic process such as a "
+            "Celery prefork pool child cannot do. Run the worker with -P solo or -P threads, "
+            "or use WHISPER_DISTRIBUTED_SECONDS to fan chunks out across the cluster instead."
+        )
+
+    key = (model_name, workers)
+    idle_pools = []
+    with _chunk_pool_lock:
+        entry = _chunk_pools.get(key)
+        if entry is None:
+            # Only one set of models is kept in memory: drop the pools nobody uses
+            for other_key, other in list(_chunk_pools.items()):
+                if not other['users']:
+                    if other['timer'] is not None:
+                        other['timer'].cancel()
+                    idle_pools.append(_chunk_pools.pop(other_key)['pool'])
+
+            # Spawn rather than fork: the parent may be a Celery pool child with torch threads running
+            threads_per_worker = max(1, (os.cpu_count() or 1) // workers)
+            entry = _chunk_pools[key] = {
+                'pool': ProcessPoolExecutor(
+                    max_workers=workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_chunk_worker,
+                    initargs=(model_name, threads_per_worker)
+                ),
+                'users': 0,
+                'timer': None,
+            }
+            logger.info(f"Started chunk pool with {workers} processes for model {model_name}")
+        if entry['timer'] is not None:
+            entry['timer'].cancel()
+            entry['timer'] = None
+        entry['users'] += 1
+
+    # Shut idle pools down outside the lock: it waits for their processes to exit
+    for pool in idle_pools:
+        pool.shutdown(wait=True)
+    return entry['pool']
+
+def release_chunk_pool(model_name, workers):
+    """Release a pool taken by get_chunk_pool(), and schedule its shutdown once it is idle."""
+    key = (model_name, workers)
+    with _chunk_pool_lock:
+        entry = _chunk_pools[key]
+        entry['users'] -= 1
+        if entry['users'] or not Config.WHISPER_CHUNK_POOL_IDLE_SECONDS:
+            return
+        entry['timer'] = threading.Timer(Config.WHISPER_CHUNK_POOL_IDLE_SECONDS, shutdown_chunk_pool,
+                                         args=(key, entry))
+        entry['timer'].daemon = True
+        entry['timer'].start()
+
+def shutdown_chunk_pool(key, entry):
+    """Stop the processes of the chunk pool `entry` for `key`, unless it is in use again."""
+    with _chunk_pool_lock:
+        if _chunk_pools.get(key) is not entry or entry['users']:
+            return
+        del _chunk_pools[key]
+    entry['pool'].shutdown(wait=True)
+    logger.info(f"Shut down idle chunk pool for model {key[0]}")
+
+def transcribe_long_audio(audio, language='auto', model_name='base', output_language=None, workers=None):
+    """
+    Transcribe long audio by splitting it at silences and transcribing the chunks in parallel.
+
+    Args:
+        audio: 16 kHz mono float32 samples
+        language: Source language code or 'auto' for auto-detection
+        model_name: Whisper model size ('tiny', 'base', 'small', 'medium', 'large')
+        output_language: Language code to translate to (None or 'same' means no translation)
+        workers: Number of pool processes (defaults to chunk_pool_size())
+    """
+    workers = workers or chunk_pool_size(model_name)
+    chunks = split_audio(audio, Config.WHISPER_CHUNK_MIN_SECONDS, Config.WHISPER_CHUNK_MAX_SECONDS)
+    logger.info(f"Transcribing {len(audio) / SAMPLE_RATE:.1f}s of audio in {len(chunks)} chunks "
+                f"across {workers} processes")
+
+    pool = get_chunk_pool(model_name, workers)
+    try:
+        chunk_results, language = _transcribe_chunks(pool, chunks, model_name,
+                                                     build_transcription_options(language, output_language))
+    finally:
+        release_chunk_pool(model_name, workers)
+
+    segments = stitch_segments(chunk_results)
+    return {
+        'text': ''.join(segment['text'] for segment in segments),
+        'segments': segments,
+        'language': language,
+    }
+
+def _transcribe_chunks(pool, chunks, model_name, transcription_options):
+    """Transcribe (offset, samples) chunks on the pool; returns the chunk results and the language."""
+    # Detect the language once so every chunk is decoded with the same one
+    if 'language' not in transcription_options or transcription_options['language'] == 'auto':
+        detected = pool.submit(detect_language, chunks[0][1], model_name).result()
+        logger.info(f"Detected language: {detected}")
+        transcription_options['language'] = detected
+
+    futures = [
+        pool.submit(_transcribe_chunk_in_worker, model_name, samples, transcription_options)
+        for _, samples in chunks
+    ]
+    chunk_results = [
+        (offset, len(samples) / SAMPLE_RATE, future.result()['segments'])
+        for (offset, samples), future in zip(chunks, futures)
+    ]
+    return chunk_results, transcription_options['language']
+
+def detect_speech(audio, frame_seconds=0.03, min_speech_seconds=0.25, min_silence_seconds=0.5,
+                  padding_seconds=0.2):
+    """
+    Find the regions of the audio that contain speech.
+
+    Frames are classified with vectorized short-time energy and zero-crossing
+    rate: a frame is speech when it is Config.WHISPER_VAD_THRESHOLD_DB above
+    the noise floor (the 10th percentile of frame energy) and its zero-crossing
+    rate is below that of broadband noise. Gaps shorter than
+    `min_silence_seconds` are bridged, bursts shorter than `min_speech_seconds`
+    are dropped and every region is padded by `padding_seconds`.
+
+    Returns an (n, 2) array of [start, end) sample indices, empty if the
+    audio contains no speech.
+    """
+    frame_size = int(frame_seconds * SAMPLE_RATE)
+    frame_count = len(audio) // frame_size
+    if frame_count == 0:
+        return np.empty((0, 2), dtype=np.int64)
+
+    frames = audio[:frame_count * frame_size].reshape(frame_count, frame_size)
+    energy_db = 10.0 * np.log10(np.mean(np.square(frames, dtype=np.float32), axis=1) + 1e-10)
+    signs = np.signbit(frames)
+    zero_crossing_rate = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / (frame_size - 1)
+
+    threshold = max(np.percentile(energy_db, 10) + Config.WHISPER_VAD_THRESHOLD_DB, Config.WHISPER_VAD_MIN_DB)
+    is_speech = (energy_db > threshold) & (zero_crossing_rate < Config.WHISPER_VAD_MAX_ZCR)
+
+    # Run boundaries of consecutive speech frames
+    edges = np.diff(np.concatenate(([0], is_speech.astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    if len(starts) == 0:
+        return np.empty((0, 2), dtype=np.int64)
+
+    # Bridge short pauses
+    keep_gap = (starts[1:] - ends[:-1]) >= int(min_silence_seconds / frame_seconds)
+    starts = np.concatenate(([starts[0]], starts[1:][keep_gap]))
+    ends = np.concatenate((ends[:-1][keep_gap], [ends[-1]]))
+
+    # Drop clicks and other short bursts
+    long_enough = (ends - starts) >= int(min_speech_seconds / frame_seconds)
+    starts, ends = starts[long_enough], ends[long_enough]
+    if len(starts) == 0:
+        return np.empty((0, 2), dtype=np.int64)
+
+    padding = int(padding_seconds * SAMPLE_RATE)
+    regions = np.stack((starts * frame_size - padding, ends * frame_size + padding), axis=1)
+    regions = np.clip(regions, 0, len(audio))
+
+    # Padding can make neighbouring regions overlap; merge those
+    overlapping = regions[1:, 0] <= regions[:-1, 1]
+    if overlapping.any():
+        region_starts = np.concatenate(([regions[0, 0]], regions[1:, 0][~overlapping]))
+        region_ends = np.concatenate((regions[:-1, 1][~overlapping], [regions[-1, 1]]))
+        regions = np.stack((region_starts, region_ends), axis=1)
+    return regions.astype(np.int64)
+
+def apply_vad(audio):
+    """
+    Drop the non-speech parts of the audio.
+
+    Returns (speech_audio, regions, skipped_seconds), where regions are the
+    speech regions of the original audio as returned by detect_speech.
+    """
+    regions = detect_speech(audio)
+    if len(regions) == 0:
+        return audio[:0], regions, len(audio) / SAMPLE_RATE
+    speech_audio = np.concatenate([audio[start:end] for start, end in regions])
+    skipped_seconds = (len(audio) - len(speech_audio)) / SAMPLE_RATE
+    logger.info(f"VAD kept {len(regions)} speech regions, skipping {skipped_seconds:.1f}s "
+                f"of {len(audio) / SAMPLE_RATE:.1f}s")
+    return speech_audio, regions, skipped_seconds
+
+def remap_segments(segments, regions):
+    """Map segment times from the speech-only audio back to the original timeline."""
+    if not segments or len(regions) == 0:
+        return segments
+
+    region_starts = regions[:, 0] / SAMPLE_RATE
+    lengths = (regions[:, 1] - regions[:, 0]) / SAMPLE_RATE
+    compact_starts = np.concatenate(([0.0], np.cumsum(lengths)[:-1]))
+
+    def to_original(times):
+        index = np.clip(np.searchsorted(compact_starts, times, side='right') - 1, 0, len(regions) - 1)
+        return region_starts[index] + np.minimum(times - compact_starts[index], lengths[index])
+
+    starts = to_original(np.array([segment['start'] for segment in segments], dtype=np.float64))
+    # An end that falls exactly on a join belongs to the region before it
+    ends = to_original(np.array([segment['end'] for segment in segments], dtype=np.float64) - 1e-6) + 1e-6
+
+    return [
+        dict(segment, start=float(start), end=float(max(start, end)))
+        for segment, start, end in zip(segments, starts, ends)
+    ]
+
+def transcribe_samples(audio, language='auto', model_name='base', output_language=None, long_media=None,
+                       vad=None):
+    """
+    Transcribe decoded audio, in parallel chunks when it is long.
+
+    The result has the usual Whisper keys plus 'audio_seconds' (duration of
+    the input) and 'skipped_seconds' (audio dropped by VAD).
+
+    Args:
+        audio: 16 kHz mono float32 samples from decode_audio
+        language: Source language code or 'auto' for auto-detection
+        model_name: Whisper model size ('tiny', 'base', 'small', 'medium', 'large')
+        output_language: Language code to translate to (None or 'same' means no translation)
+        long_media: Split the audio and transcribe the chunks in parallel; None decides
+            from the duration (Config.WHISPER_LONG_MEDIA_SECONDS)
+        vad: Skip non-speech audio before inference; None uses Config.WHISPER_VAD_ENABLED
+    """
+    audio_seconds = len(audio) / SAMPLE_RATE
+    regions = None
+    skipped_seconds = 0.0
+    
+    if Config.WHISPER_VAD_ENABLED if vad is None else vad:
+        audio, regions, skipped_seconds = apply_vad(audio)
+        if len(regions) == 0:
+            logger.info("No speech detected, skipping transcription")
+            return {
+                'text': '',
+                'segments': [],
+                'language': None if language == 'auto' else language,
+                'audio_seconds': audio_seconds,
+                'skipped_seconds': skipped_seconds,
+            }
     
-    # Create temporary file for the subtitles
-    subtitle_path = tempfile.mktemp(suffix=f'.{format_type}')
+    if long_media is None:
+        threshold = Config.WHISPER_LONG_MEDIA_SECONDS
+        long_media = bool(threshold) and len(audio) / SAMPLE_RATE > threshold
     
+    transcribe = transcribe_long_audio if long_media else transcribe_audio
+    result = transcribe(audio, language=language, model_name=model_name, output_language=output_language)
+    
+    if regions is not None:
+        result['segments'] = remap_segments(result['segments'], regions)
+    result['audio_seconds'] = audio_seconds
+    result['skipped_seconds'] = skipped_seconds
+    return result
+
+# Number of cues rendered per batch by render_subtitles
+RENDER_BATCH_SIZE = 4096
+
+def render_cues(segments, vtt=False):
+    """Render numbered SRT/VTT cues, yielding one string per batch of RENDER_BATCH_SIZE segments."""
+    for batch_start in range(0, len(segments), RENDER_BATCH_SIZE):
+        batch = segments[batch_start:batch_start + RENDER_BATCH_SIZE]
+        start_times = format_timestamps([segment['start'] for segment in batch], vtt=vtt)
+        end_times = format_timestamps([segment['end'] for segment in batch], vtt=vtt)
+        yield ''.join([
+            f"{i}\n{start_time} --> {end_time}\n{segment['text'].strip()}\n\n"
+            for i, start_time, end_time, segment
+            in zip(range(batch_start + 1, batch_start + len(batch) + 1), start_times, end_times, batch)
+        ])
+
+def render_subtitles(segments, format_type='srt'):
+    """Render segments in the specified subtitle format, yielding the output piece by piece."""
+    segments = segments if isinstance(segments, list) else list(segments)
+    
+    if format_type == 'srt':
+        yield from render_cues(segments)
+    
+    elif format_type == 'vtt':
+        yield "WEBVTT\n\n"
+        yield from render_cues(segments, vtt=True)
+    
+    elif format_type == 'txt':
+        for segment in segments:
+            yield f"{segment['text'].strip()}\n"
+    
+    elif format_type == 'json':
+        yield "["
+        for i, segment in enumerate(segments):
+            entry = {'start': segment['start'], 'end': segment['end'], 'text': segment['text'].strip()}
+            yield ("," if i else "") + json.dumps(entry, ensure_ascii=False)
+        yield "]\n"
+    
+    else:
+        raise ValueError(f"Unsupported subtitle format: {format_type}")
+
+def format_subtitles(transcription, format_type='srt'):
+    """
+    Format transcription results to the specified subtitle format.
+    
+    Returns an in-memory binary buffer holding the UTF-8 subtitles, positioned
+    at the start, so it can be uploaded without touching the filesystem.
+    """
+    buffer = io.BytesIO()
     try:
-        with open(subtitle_path, 'w', encoding='utf-8') as f:
-            if format_type == 'srt':
-                for i, segment in enumerate(segments, 1):
-                    # Format time (start and end in seconds to SRT format)
-                    start_time = format_timestamp(segment['start'])
-                    end_time = format_timestamp(segment['end'])
-                    text = segment['text'].strip()
-                    
-                    # Write SRT entry
-                    f.write(f"{i}\n")
-                    f.write(f"{start_time} --> {end_time}\n")
-                    f.write(f"{text}\n\n")
-            
-            elif format_type == 'vtt':
-                f.write("WEBVTT\n\n")
-                for i, segment in enumerate(segments, 1):
-                    start_time = format_timestamp(segment['start'], vtt=True)
-                    end_time = format_timestamp(segment['end'], vtt=True)
-                    text = segment['text'].strip()
-                    
-                    # Write VTT entry
-                    f.write(f"{i}\n")
-                    f.write(f"{start_time} --> {end_time}\n")
-                    f.write(f"{text}\n\n")
-            
-            elif format_type == 'txt':
-                for segment in segments:
-                    f.write(f"{segment['text'].strip()}\n")
-        
-        return subtitle_path
+        for piece in render_subtitles(transcription['segments'], format_type):
+            buffer.write(piece.encode('utf-8'))
+        buffer.seek(0)
+        return buffer
     except Exception as e:
-        # Clean up temporary file if formatting fails
-        if os.path.exists(subtitle_path):
-            os.remove(subtitle_path)
         logger.error(f"Error formatting subtitles: {str(e)}")
         raise
 
 def format_timestamp(seconds, vtt=False):
     """Convert seconds to timestamp format HH:MM:SS,mmm or HH:MM:SS.mmm for VTT."""
-    hours = int(seconds / 3600)
-    minutes = int((seconds % 3600) / 60)
-    seconds = seconds % 60
+    # Round to whole milliseconds first, so 59.9996 becomes 00:01:00,000 rather than 00:00:60,000
+    milliseconds = int(round(max(seconds, 0) * 1000))
+    hours, milliseconds = divmod(milliseconds, 3600000)
+    minutes, milliseconds = divmod(milliseconds, 60000)
+    seconds, milliseconds = divmod(milliseconds, 1000)
     
-    if vtt:
-        return f"{hours:02d}:{minutes:02d}:{seconds:06.3f}".replace('.', '.')
-    else:
-        return f"{hours:02d}:{minutes:02d}:{seconds:06.3f}".replace('.', ',')
+    separator = '.' if vtt else ','
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d}{separator}{milliseconds:03d}"
 
-def process_file(file_path, language='auto', model='base', format_type='srt', output_language='same'):
+def format_timestamps(seconds, vtt=False):
+    """
+    Convert many times in seconds to timestamps at once.
+    
+    Produces the same strings as format_timestamp, but does the arithmetic
+    with NumPy integer operations over the whole array and assembles the
+    digits as a fixed-width character array.
+    """
+    milliseconds = np.rint(np.maximum(np.asarray(seconds, dtype=np.float64), 0) * 1000).astype(np.int64)
+    if milliseconds.size == 0:
+        return []
+    
+    hours, milliseconds = np.divmod(milliseconds, 3600000)
+    if hours.max() > 99:
+        # Wider than the fixed HH:MM:SS,mmm layout
+        return [format_timestamp(value, vtt=vtt) for value in np.asarray(seconds, dtype=np.float64).tolist()]
+    minutes, milliseconds = np.divmod(milliseconds, 60000)
+    whole_seconds, milliseconds = np.divmod(milliseconds, 1000)
+    
+    chars = np.empty((len(hours), 12), dtype=np.uint8)
+    chars[:, 0], chars[:, 1] = np.divmod(hours, 10)
+    chars[:, 3], chars[:, 4] = np.divmod(minutes, 10)
+    chars[:, 6], chars[:, 7] = np.divmod(whole_seconds, 10)
+    chars[:, 9], rest = np.divmod(milliseconds, 100)
+    chars[:, 10], chars[:, 11] = np.divmod(rest, 10)
+    chars += ord('0')
+    chars[:, 2] = chars[:, 5] = ord(':')
+    chars[:, 8] = ord('.' if vtt else ',')
+    
+    return chars.view('S12').ravel().astype('U12').tolist()
+
+def process_file(file_path, language='auto', model='base', format_type='srt', output_language='same',
+                 long_media=None):
     """
     Process a media file to generate subtitles.
     
+    Returns the subtitles as an in-memory binary buffer (see format_subtitles).
+    
     Args:
         file_path: Path to media file
         language: Source language code or 'auto' for auto-detection
         model: Whisper model size ('tiny', 'base', 'small', 'medium', 'large')
-        format_type: Output format ('srt', 'vtt', 'txt')
+        format_type: Output format ('srt', 'vtt', 'txt', 'json')
         output_language: Target language code for translation ('same' means no translation)
+        long_media: Split the audio and transcribe the chunks in parallel; None decides
+            from the duration (Config.WHISPER_LONG_MEDIA_SECONDS)
     """
     logger.info(f"Processing file: {file_path}")
     logger.info(f"Parameters: language={language}, output_language={output_language}, model={model}, format={format_type}")
     
-    temp_files = []
-    
     try:
-        # Determine if we need to extract audio (for video files)
-        file_ext = Path(file_path).suffix.lower()
-        is_video = file_ext not in ['.mp3', '.wav', '.flac', '.ogg', '.m4a']
-        
-        audio_path = file_path
-        if is_video and FFMPEG_AVAILABLE:
-            logger.info("Extracting audio from video...")
-            audio_path = extract_audio(file_path)
-            temp_files.append(audio_path)
+        # Decode audio (from video or audio files alike) once, straight into memory
+        logger.info("Decoding audio...")
+        audio = decode_audio(file_path)
         
         # Transcribe the audio
         logger.info("Transcribing audio...")
-        transcription = transcribe_audio(
-            audio_path, 
+        transcription = transcribe_samples(
+            audio, 
             language=language, 
             model_name=model, 
-            output_language=None if output_language == 'same' else output_language
+            output_language=None if output_language == 'same' else output_language,
+            long_media=long_media
         )
         
         # Format subtitles
         logger.info(f"Formatting subtitles as {format_type}...")
-        subtitle_path = format_subtitles(transcription, format_type)
-        
-        return subtitle_path
+        return format_subtitles(transcription, format_type)
     
     except Exception as e:
-        # Clean up any temporary files
-        for temp_file in temp_files:
-            if os.path.exists(temp_file):
-                os.remove(temp_file)
-        
         logger.error(f"Error in processing file: {str(e)}")
         raise